@@ -0,0 +1,380 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from Bot import *
+from ChunkedGame import *
+
+
+# The names of the five steps of Bot.construct_probability_tables, as timed in SolverStats.step_times.
+STEP_NAMES = ("constraints", "islands", "search", "combine", "nonborder")
+
+# The node budget of every exact island search. The few positions that go over it are estimated, which is reported.
+DEFAULT_NODE_BUDGET = 5000000
+
+# Positions with at most this many unknown cells are checked against brute force enumeration, which takes 2^n steps.
+# The arrangements are enumerated a block at a time.
+BRUTE_FORCE_CELLS = 20
+BRUTE_FORCE_BLOCK = 1 << 16
+
+# The largest difference from the brute force probabilities that passes. Probability tables are rounded to 8 digits.
+EXACTNESS_TOLERANCE = 1e-7
+
+
+class BenchmarkPosition:
+    """
+    A position of the benchmark corpus, which the bot constructs a probability table for.
+
+    :ivar name: The name of the position, which is unique within the corpus and fixed across commits.
+    :type name: str
+    :ivar category: The kind of position (see build_corpus).
+    :type category: str
+    :ivar game: The game in the position. It is forked for every run, so it is never changed.
+    :type game: Game
+    """
+
+    def __init__(self, name, category, game):
+        self.name = name
+        self.category = category
+        self.game = game
+
+
+def visible_position(mine_mask, revealed_mask, flagged_mask=None):
+    """
+    :param mine_mask: A 2D boolean numpy array of the mines of the board.
+    :param revealed_mask: A 2D boolean numpy array of the cells to show. Mines are never shown, and the cells around
+                          every zero shown are shown too, as a chain reveal would, since the bot relies on that.
+    :param flagged_mask: An optional 2D boolean numpy array of the cells to flag.
+    :return: A game showing the given cells of the board (see Game.from_visible_state).
+    """
+
+    surrounding_counts = count_neighbours(mine_mask)
+    revealed_mask = revealed_mask & ~mine_mask
+    while True:
+        opened = (revealed_mask | (count_neighbours(revealed_mask & (surrounding_counts == 0)) > 0)) & ~mine_mask
+        if np.array_equal(opened, revealed_mask):
+            break
+        revealed_mask = opened
+    if flagged_mask is None:
+        flagged_mask = np.zeros(mine_mask.shape, dtype=bool)
+    return Game.from_visible_state(surrounding_counts, revealed_mask, flagged_mask & ~revealed_mask,
+                                   int(np.count_nonzero(mine_mask)))
+
+
+def reveal_openings(game, count, seed):
+    """
+    Chain reveals random cells of a game, skipping any that would lose it, until count of them have revealed a number.
+
+    :return: The game with the cells revealed, which may be a fork of the one given.
+    """
+
+    rng = np.random.default_rng(seed)
+    while count > 0:
+        trial = game.fork()
+        trial.chain_reveal(int(rng.integers(game.get_rows())), int(rng.integers(game.get_columns())))
+        if trial.get_game_outcome() == GameOutcome.INCONCLUSIVE and trial.get_revealed_number_cells():
+            game = trial
+            count -= 1
+    return game
+
+
+def build_corpus():
+    """
+    Builds the fixed corpus of positions, which are the same on every run. They come in five categories:
+
+    - long_walls: a single revealed row across a wide board, whose numbers each constrain the three cells above and
+      below them, making long thin islands.
+    - small_islands: cells revealed on a sparse lattice, each making an island of its own.
+    - giant_island: cells revealed on a dense lattice, whose numbers share cells, making one large island.
+    - endgame: an expert board with every safe cell revealed but a small block, with and without the other mines
+      flagged.
+    - huge_sparse: a few openings on boards of a million cells and of ten billion cells (see ChunkedGame).
+
+    The islands of wall_16x200 and giant_11x11 are past what the exact search can count within DEFAULT_NODE_BUDGET, but
+    they are narrow enough to be counted exactly by sweeping their frontier (see count_island_solutions_frontier).
+
+    :return: A list of BenchmarkPositions.
+    """
+
+    positions = []
+
+    for columns in (60, 120, 200):
+        mines = generate_mine_mask(16, columns, int(16 * columns * 0.15), seed=columns)
+        revealed = np.zeros(mines.shape, dtype=bool)
+        revealed[7] = True
+        positions.append(BenchmarkPosition(f"wall_16x{columns}", "long_walls", visible_position(mines, revealed)))
+
+    for size, mine_count, seed in ((40, 240, 5), (100, 1500, 6)):
+        mines = generate_mine_mask(size, size, mine_count, seed=seed)
+        revealed = np.zeros(mines.shape, dtype=bool)
+        revealed[2::4, 2::4] = True
+        positions.append(BenchmarkPosition(f"islands_{size}x{size}", "small_islands",
+                                           visible_position(mines, revealed)))
+
+    for rows, columns, mine_count, seed in ((9, 13, 23, 1), (9, 9, 20, 1), (11, 11, 30, 0)):
+        mines = generate_mine_mask(rows, columns, mine_count, seed=seed)
+        revealed = np.zeros(mines.shape, dtype=bool)
+        revealed[1::2, 1::2] = True
+        positions.append(BenchmarkPosition(f"giant_{rows}x{columns}", "giant_island",
+                                           visible_position(mines, revealed)))
+
+    mines = generate_mine_mask(16, 30, 99, seed=10)
+    hidden = np.zeros(mines.shape, dtype=bool)
+    hidden[6:10, 12:17] = True
+    positions.append(BenchmarkPosition("endgame_16x30", "endgame", visible_position(mines, ~hidden)))
+    positions.append(BenchmarkPosition("endgame_16x30_flagged", "endgame",
+                                       visible_position(mines, ~hidden, mines & ~hidden)))
+
+    game = reveal_openings(Game.from_layout(generate_mine_mask(1000, 1000, 20000, seed=11)), 4, 11)
+    positions.append(BenchmarkPosition("sparse_1000x1000", "huge_sparse", game))
+    game = reveal_openings(ChunkedGame(100000, 100000, 0.12, seed=13), 16, 13)
+    positions.append(BenchmarkPosition("sparse_100000x100000", "huge_sparse", game))
+    return positions
+
+
+def enumerate_probabilities(game):
+    """
+    Finds the probability that each unknown (unrevealed and unflagged) cell of a game is not a mine, by checking every
+    arrangement of the unflagged mines left among the unknown cells against every revealed number. Flags are assumed
+    to be on mines, as they are by the bot. This takes 2^n steps for n unknown cells, so it only suits small boards,
+    but it shares nothing with the bot's solver, so it can check it.
+
+    :return: A dictionary from every unknown cell to the probability it is not a mine, or None if no arrangement fits.
+    """
+
+    revealed, flagged = np.array(game.get_revealed_mask()), np.array(game.get_flagged_mask())
+    unknown = [tuple(cell) for cell in np.argwhere(~revealed & ~flagged).tolist()]
+    index = {cell: i for i, cell in enumerate(unknown)}
+    remaining_mines = game.get_unused_flag_count()
+
+    # Each number's constraint, as the indices of its unknown cells and the mines among them.
+    constraints = []
+    surrounding_counts = game.get_surrounding_count_grid()
+    flag_counts = count_neighbours(flagged)
+    for row, column in np.argwhere(revealed).tolist():
+        neighbours = [index[cell] for cell in game.get_surrounding_cells(row, column) if cell in index]
+        mines_needed = int(surrounding_counts[row, column]) - int(flag_counts[row, column])
+        if neighbours or mines_needed != 0:
+            constraints.append((np.array(neighbours, dtype=np.int64), mines_needed))
+
+    arrangement_count = 0
+    cell_mine_counts = np.zeros(len(unknown), dtype=np.int64)
+    bit_positions = np.arange(len(unknown), dtype=np.int64)
+    for block_start in range(0, 1 << len(unknown), BRUTE_FORCE_BLOCK):
+        block = np.arange(block_start, min(block_start + BRUTE_FORCE_BLOCK, 1 << len(unknown)), dtype=np.int64)
+        arrangements = ((block[:, None] >> bit_positions) & 1).astype(np.uint8)
+        fits = arrangements.sum(axis=1) == remaining_mines
+        for neighbours, mines_needed in constraints:
+            fits &= arrangements[:, neighbours].sum(axis=1) == mines_needed
+        arrangement_count += int(np.count_nonzero(fits))
+        cell_mine_counts += arrangements[fits].sum(axis=0, dtype=np.int64)
+
+    if arrangement_count == 0:
+        return None
+    return {cell: 1 - int(mine_count) / arrangement_count for cell, mine_count in zip(unknown, cell_mine_counts)}
+
+
+def check_exactness(game, probability_table):
+    """
+    Compares a probability table with the brute force probabilities (see enumerate_probabilities).
+
+    :return: A JSON serializable dictionary of the number of unknown cells, the largest difference between the table and
+    the brute force probabilities, and whether it is within EXACTNESS_TOLERANCE.
+    """
+
+    brute_force = enumerate_probabilities(game)
+    if brute_force is None:
+        return {"cells": 0, "max_error": None, "passed": False}
+    max_error = max((abs(probability_table.get(cell, -1.0) - probability)
+                     for cell, probability in brute_force.items()), default=0.0)
+    return {"cells": len(brute_force), "max_error": max_error, "passed": bool(max_error <= EXACTNESS_TOLERANCE)}
+
+
+def count_unknown_cells(game):
+    return game.get_rows() * game.get_columns() - int(np.count_nonzero(game.get_revealed_mask() |
+                                                                       game.get_flagged_mask()))
+
+
+def run_position(position, repeat=3, solver_backend=None, node_budget=DEFAULT_NODE_BUDGET):
+    """
+    Constructs a position's probability table repeat times, each with a new bot and island cache, then once more to
+    measure its peak memory, and checks the table against brute force if the position is small enough.
+
+    :param position: The BenchmarkPosition to run.
+    :param repeat: The number of timed runs.
+    :param solver_backend: The island solver of the bots (see Bot.solver_backend).
+    :param node_budget: The node budget of the bots.
+    :return: A JSON serializable dictionary of the results. The step times, search nodes and frontier sweeps are those
+    of the fastest run, and nodes_per_second is over the time of the search step spent outside frontier sweeps.
+    invalid_probabilities counts the probabilities of the table that are not numbers from 0 to 1, which should never
+    happen, but which no brute force check can catch on a large board.
+    """
+
+    # Estimated islands are sampled with the global random state, which is seeded the same for every run.
+    wall_times = []
+    fastest_stats = None
+    probability_table = None
+    for _ in range(repeat):
+        random.seed(0)
+        bot = Bot(position.game.fork(), node_budget=node_budget, stats=SolverStats(), solver_backend=solver_backend)
+        start = time.perf_counter()
+        probability_table = bot.construct_probability_tables()
+        wall_times.append(time.perf_counter() - start)
+        if wall_times[-1] == min(wall_times):
+            fastest_stats = bot.last_table_stats
+
+    # Measured apart from the timed runs, as tracing allocations slows them down.
+    random.seed(0)
+    bot = Bot(position.game.fork(), node_budget=node_budget, solver_backend=solver_backend)
+    tracemalloc.start()
+    try:
+        bot.construct_probability_tables()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    search_time = fastest_stats.step_times[2] - fastest_stats.frontier_time
+    is_small = position.game.get_rows() * position.game.get_columns() <= 10 ** 6
+    unknown_cells = count_unknown_cells(position.game) if is_small else None
+    exact_check = None
+    if unknown_cells is not None and unknown_cells <= BRUTE_FORCE_CELLS:
+        exact_check = check_exactness(position.game, probability_table)
+    return {"name": position.name,
+            "category": position.category,
+            "rows": position.game.get_rows(),
+            "columns": position.game.get_columns(),
+            "unknown_cells": unknown_cells,
+            "wall_time_min": min(wall_times),
+            "wall_time_median": statistics.median(wall_times),
+            "step_times": dict(zip(STEP_NAMES, fastest_stats.step_times)),
+            "island_sizes": {str(size): count for size, count in sorted(fastest_stats.island_sizes.items())},
+            "estimated_islands": fastest_stats.estimated_islands,
+            "nodes_visited": fastest_stats.nodes_visited,
+            "frontier_islands": fastest_stats.frontier_islands,
+            "frontier_states": fastest_stats.frontier_states,
+            "frontier_time": fastest_stats.frontier_time,
+            "nodes_per_second": fastest_stats.nodes_visited / search_time if search_time > 0 else None,
+            "peak_memory_bytes": peak_memory,
+            "invalid_probabilities": sum(not 0.0 <= probability <= 1.0 for probability in probability_table.values()),
+            "exact_check": exact_check}
+
+
+def small_board_positions(count, seed=0):
+    """
+    Makes random positions on small boards, a few chain reveals into a game, for cross-checking against brute force.
+    Each is also given with a random selection of its hidden mines flagged, always including one away from the
+    revealed numbers where there is one, since flags change both the numbers' constraints and the cells left for the
+    other mines.
+
+    :return: A list of count BenchmarkPositions, and of the flagged copy of each that still has unknown cells, in the
+    small_boards category.
+    """
+
+    rng = random.Random(seed)
+    flag_rng = random.Random(seed + 1)
+    positions = []
+    flagged_positions = []
+    while len(positions) < count:
+        rows, columns = rng.choice(((4, 5), (5, 5), (4, 6), (6, 6)))
+        mines = generate_mine_mask(rows, columns, rng.randint(2, rows * columns // 3), seed=rng.getrandbits(32))
+        game = reveal_openings(Game.from_layout(mines), rng.randint(1, 4), rng.getrandbits(32))
+        if not 0 < count_unknown_cells(game) <= BRUTE_FORCE_CELLS:
+            continue
+        positions.append(BenchmarkPosition(f"small_{len(positions)}", "small_boards", game))
+
+        hidden_mines = [tuple(cell) for cell in np.argwhere(mines & ~np.array(game.get_revealed_mask())).tolist()]
+        border_cells = set(game.get_unrevealed_border_cells())
+        nonborder_mines = [cell for cell in hidden_mines if cell not in border_cells]
+        flags = set(flag_rng.sample(hidden_mines, flag_rng.randint(1, len(hidden_mines))))
+        if nonborder_mines:
+            flags.add(flag_rng.choice(nonborder_mines))
+        flagged_game = game.fork()
+        for row, column in flags:
+            flagged_game.flag(row, column)
+        if count_unknown_cells(flagged_game) > 0:
+            flagged_positions.append(BenchmarkPosition(f"small_{len(positions) - 1}_flagged", "small_boards",
+                                                       flagged_game))
+    return positions + flagged_positions
+
+
+def run_benchmark(positions, repeat=3, solver_backend=None, node_budget=DEFAULT_NODE_BUDGET, progress=None):
+    """
+    :param positions: The BenchmarkPositions to run.
+    :param repeat: The number of timed runs of each position.
+    :param solver_backend: The island solver of the bots (see Bot.solver_backend). One not in SOLVER_BACKENDS is
+                           reported by its function name.
+    :param node_budget: The node budget of the bots.
+    :param progress: An optional function called with the results of each position as it finishes.
+    :return: A JSON serializable dictionary of the environment and settings, the results of each position (see
+    run_position) in order, and a summary of the exactness checks.
+    """
+
+    results = []
+    for position in positions:
+        results.append(run_position(position, repeat, solver_backend, node_budget))
+        if progress is not None:
+            progress(results[-1])
+
+    checks = [result["exact_check"] for result in results if result["exact_check"] is not None]
+    if solver_backend is None:
+        solver_backend = default_solver_backend()
+    backend_name = next((name for name, backend in SOLVER_BACKENDS.items() if backend is solver_backend),
+                        getattr(solver_backend, "__name__", "custom"))
+    return {"environment": {"python": platform.python_version(),
+                            "numpy": np.__version__,
+                            "numba": None if numba is None else numba.__version__,
+                            "platform": platform.platform()},
+            "settings": {"repeat": repeat,
+                         "solver_backend": backend_name,
+                         "node_budget": node_budget},
+            "positions": results,
+            "exactness": {"checked": len(checks),
+                          "passed": sum(check["passed"] for check in checks),
+                          "max_error": max((check["max_error"] for check in checks
+                                            if check["max_error"] is not None), default=None)}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the probability engine on a fixed corpus of positions.")
+    parser.add_argument("--output", default="benchmark.json", help="File to write the results to as JSON.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--category", nargs="+", help="Only run the positions of these categories.")
+    parser.add_argument("--small-boards", type=int, default=50,
+                        help="Number of random small board positions to cross-check against brute force. Each is "
+                             "also checked with some of its mines flagged.")
+    parser.add_argument("--solver-backend", choices=sorted(SOLVER_BACKENDS),
+                        help="Island solver to use. Defaults to compiled if numba is installed, otherwise python.")
+    parser.add_argument("--node-budget", type=int, default=DEFAULT_NODE_BUDGET)
+    args = parser.parse_args(argv)
+
+    # As in Simulation, the compiled backend's warm-up is reported on its own, so that it does not skew the first
+    # position.
+    solver_backend = default_solver_backend() if args.solver_backend is None else SOLVER_BACKENDS[args.solver_backend]
+    if solver_backend is count_island_solutions_compiled:
+        print(json.dumps({"solver_backend": "compiled", "compiled": numba is not None,
+                          "warm_up_time": warm_up_compiled_solver()}), file=sys.stderr)
+    positions = build_corpus() + small_board_positions(args.small_boards)
+    if args.category:
+        positions = [position for position in positions if position.category in args.category]
+
+    def progress(result):
+        check = result["exact_check"]
+        print(f"{result['name']:<24} {result['wall_time_min']:9.4f}s  nodes {result['nodes_visited']:>9}  "
+              f"frontier {result['frontier_islands']}  estimated {result['estimated_islands']}  "
+              f"peak {result['peak_memory_bytes'] / 2 ** 20:7.1f} MiB"
+              + (f"  invalid {result['invalid_probabilities']}" if result["invalid_probabilities"] else "")
+              + ("" if check is None else f"  exact {'ok' if check['passed'] else 'FAILED'}"), file=sys.stderr)
+
+    report = run_benchmark(positions, args.repeat, solver_backend, args.node_budget, progress)
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+        output.write("\n")
+    print(json.dumps(report["exactness"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import json
+import struct
+
+from GameStructures import *
+
+
+# A corpus file starts with MAGIC, the number of boards (uint64) and the length of a JSON header (uint32), followed by
+# the header itself, padded to a multiple of 8 bytes. The header holds the board shape and any caller metadata. The
+# boards follow as fixed size records (see record_dtype), so any of them can be read straight from a memory map.
+MAGIC = b"MSCORPUS"
+PREFIX = struct.Struct("<8sQI")
+
+
+def record_dtype(rows, columns):
+    """
+    :param rows: The number of rows of the boards.
+    :param columns: The number of columns of the boards.
+    :return: The numpy structured dtype of a single board record. It holds the seed the board was generated with (-1
+    if unknown), its mine count, and its mine mask packed 8 cells to a byte in row-major order.
+    """
+
+    return np.dtype([("seed", "<i8"), ("mine_count", "<u4"), ("mask", "u1", ((rows * columns + 7) // 8,))])
+
+
+def write_corpus(path, rows, columns, boards, metadata=None):
+    """
+    Writes mine layouts to a corpus file. The boards are streamed, so the iterable may be arbitrarily long.
+
+    :param path: The path of the file to write.
+    :param rows: The number of rows of every board.
+    :param columns: The number of columns of every board.
+    :param boards: An iterable of (mine mask, seed) tuples, where the seed may be None if unknown.
+    :param metadata: An optional JSON serializable dictionary stored in the header, e.g. describing how the boards
+                     were made.
+    :return: The number of boards written.
+    """
+
+    header = json.dumps({"rows": rows, "columns": columns, "metadata": metadata or {}}).encode()
+    header += b" " * (-(PREFIX.size + len(header)) % 8)
+    dtype = record_dtype(rows, columns)
+    count = 0
+    with open(path, "wb") as corpus_file:
+        corpus_file.write(PREFIX.pack(MAGIC, 0, len(header)))
+        corpus_file.write(header)
+        record = np.zeros(1, dtype=dtype)
+        for mine_mask, seed in boards:
+            mine_mask = np.asarray(mine_mask, dtype=bool)
+            if mine_mask.shape != (rows, columns):
+                raise ValueError(f"board {count} has shape {mine_mask.shape}, expected {(rows, columns)}")
+            record["seed"] = -1 if seed is None else seed
+            record["mine_count"] = np.count_nonzero(mine_mask)
+            record["mask"] = np.packbits(mine_mask.ravel())
+            corpus_file.write(record.tobytes())
+            count += 1
+        corpus_file.seek(0)
+        corpus_file.write(PREFIX.pack(MAGIC, count, len(header)))
+    return count
+
+
+def generate_corpus(path, rows, columns, mine_count, count, seed=0, metadata=None):
+    """
+    Writes a corpus of random boards, where board k is the board Game(rows, columns, mine_count, seed + k) would make.
+
+    :param path: The path of the file to write.
+    :param rows: The number of rows of every board.
+    :param columns: The number of columns of every board.
+    :param mine_count: The number of mines on every board.
+    :param count: The number of boards.
+    :param seed: The seed of the first board.
+    :param metadata: Optional extra metadata to store in the header (see write_corpus).
+    :return: The number of boards written.
+    """
+
+    metadata = dict(metadata or {}, mine_count=mine_count, seed=seed)
+    boards = ((generate_mine_mask(rows, columns, mine_count, seed + k), seed + k) for k in range(count))
+    return write_corpus(path, rows, columns, boards, metadata)
+
+
+class BoardCorpus:
+    """
+    A read-only, memory-mapped corpus file. Boards are only read from disk when they are used, so corpora much larger
+    than memory can be streamed.
+
+    :ivar rows: The number of rows of every board.
+    :type rows: int
+    :ivar columns: The number of columns of every board.
+    :type columns: int
+    :ivar metadata: The metadata stored in the header by write_corpus.
+    :type metadata: dict
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as corpus_file:
+            magic, count, header_length = PREFIX.unpack(corpus_file.read(PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a board corpus")
+            header = json.loads(corpus_file.read(header_length))
+        self.rows = header["rows"]
+        self.columns = header["columns"]
+        self.metadata = header["metadata"]
+        self.__records__ = np.memmap(path, dtype=record_dtype(self.rows, self.columns), mode="r",
+                                     offset=PREFIX.size + header_length, shape=(count,))
+
+    def __len__(self):
+        return len(self.__records__)
+
+    def get_seed(self, index):
+        seed = int(self.__records__[index]["seed"])
+        return None if seed < 0 else seed
+
+    def get_mine_mask(self, index):
+        packed = self.__records__[index]["mask"]
+        return np.unpackbits(packed, count=self.rows * self.columns).reshape(self.rows, self.columns).astype(bool)
+
+    def get_game(self, index):
+        return Game.from_layout(self.get_mine_mask(index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.get_game(index)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a corpus of seeded minesweeper boards.")
+    parser.add_argument("output")
+    parser.add_argument("--rows", type=int, required=True)
+    parser.add_argument("--columns", type=int, required=True)
+    parser.add_argument("--mines", type=int, required=True)
+    parser.add_argument("--count", type=int, required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    generate_corpus(args.output, args.rows, args.columns, args.mines, args.count, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,105 @@
-import itertools
+import time
 
+from CompiledSolver import *
 from GameStructures import *
+from IslandSolver import *
 
 
-NOT_MINE = 0
-MINE = 1
+# The number of random cells random_decision draws, looking for an unrevealed one, before it scans the whole board.
+RANDOM_DECISION_TRIES = 64
 
 
 class Bot:
     """
     This class corresponds to a bot that plays minesweeper.
 
-    :ivar to_reveal: A dynamically updating list of cells the bot deems the best option(s) to reveal.
-    :type to_reveal: List[Tuple[int, int]]
-    :ivar to_flag: A dynamically updating list of cells the bot deems the best option(s) to flag.
-    :type to_flag: List[Tuple[int, int]]
+    :ivar to_reveal: A dynamically updating set of cells the bot deems the best option(s) to reveal.
+    :type to_reveal: Set[Tuple[int, int]]
+    :ivar to_flag: A dynamically updating set of cells the bot deems the best option(s) to flag.
+    :type to_flag: Set[Tuple[int, int]]
     :ivar game: A game object that provides the bot with the current game state which allows it to make decisions. This
                 object updates as the game progresses, meaning the bot does not need to repeatedly pass in a game object
                 as a parameter to its methods.
     :type game: Game
+    :ivar guess_count: The number of reveals the bot has chosen without being certain the cell was safe.
+    :type guess_count: int
+    :ivar island_cache: A cache of solved islands, reused between calls to construct_probability_tables. Each bot
+                        makes its own unless one is passed in, so it may be shared between bots. If set to None, every
+                        island is solved from scratch.
+    :type island_cache: IslandCache
+    :ivar island_executor: An optional persistent process pool (see create_island_executor) that large islands are
+                           solved in, in parallel. If None, every island is solved in this process.
+    :type island_executor: concurrent.futures.Executor
+    :ivar inline_island_size: The smallest island that is sent to the island_executor. Smaller islands are solved in
+                              this process, as they are not worth the overhead of sending to another.
+    :type inline_island_size: int
+    :ivar time_budget: The default number of seconds construct_probability_tables may spend on exact island searches
+                       before estimating the remaining islands instead, or None for no limit.
+    :type time_budget: float
+    :ivar node_budget: The default number of search nodes construct_probability_tables may visit per island before
+                       estimating it instead, or None for no limit.
+    :type node_budget: int
+    :ivar exact_weights: Whether construct_probability_tables weights arrangements with exact integers rather than
+                         floating point numbers (see combine_island_solutions). Exact weighting is slow on large boards.
+    :type exact_weights: bool
+    :ivar approximate_islands: The islands whose probabilities were estimated in the last probability table.
+    :type approximate_islands: List[Tuple[Tuple[int, int]]]
+    :ivar confidence_intervals: A dictionary from every cell of an approximate island in the last probability table
+                                to a 95% confidence interval (low, high) of the probability it is not a mine.
+    :type confidence_intervals: Dict[Tuple[int, int], Tuple[float, float]]
+    :ivar stats: An optional SolverStats that the instrumentation of every probability table, and every guess, is added
+                 to. If None, nothing is recorded.
+    :type stats: SolverStats
+    :ivar last_table_stats: The instrumentation of the last probability table alone, if stats is not None.
+    :type last_table_stats: SolverStats
+    :ivar solver_backend: The function that counts the arrangements of each island, which takes the same arguments and
+                          gives the same counts as count_island_solutions (see SOLVER_BACKENDS). Defaults to the
+                          compiled backend when numba is installed, and the pure Python one otherwise.
+    :type solver_backend: Callable[..., IslandSolution]
     """
 
-    def __init__(self, game):
+    def __init__(self, game, island_cache=None, island_executor=None, inline_island_size=INLINE_ISLAND_SIZE,
+                 time_budget=None, node_budget=None, exact_weights=False, stats=None, solver_backend=None):
 
-        self.to_reveal = []
-        self.to_flag = []
+        self.to_reveal = set()
+        self.to_flag = set()
         self.game = game
-
-    def take_action(self):
+        self.guess_count = 0
+        self.island_cache = IslandCache() if island_cache is None else island_cache
+        self.island_executor = island_executor
+        self.inline_island_size = inline_island_size
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+        self.exact_weights = exact_weights
+        self.approximate_islands = []
+        self.confidence_intervals = {}
+        self.stats = stats
+        self.last_table_stats = None
+        self.solver_backend = default_solver_backend() if solver_backend is None else solver_backend
+
+        # The last probability table used by complex_deduction, and the game state version it was constructed for, and
+        # the last game state version that basic and linear deduction found nothing certain in.
+        self.__table_version__ = None
+        self.__table__ = None
+        self.__exhausted_version__ = None
+
+        # The game's changes not yet seen by basic_deduction, and the number cells it has to look at (again). Every
+        # number cell is looked at the first time.
+        self.__change_feed__ = game.watch_changes()
+        self.__dirty_cells__ = set(game.get_revealed_number_cells())
+
+    def take_action(self, printing=True):
         """
         Either reveals or flags a single cell in a game of minesweeper. More specifically, in the game of
         minesweeper stored in this class's fields. Which cell to reveal is determined by various deduction methods from
         this class.
+
+        :param printing: A boolean parameter that determines whether a message is printed when the bot is forced to
+                         guess at random. Guesses from a probability table are recorded in the stats field instead.
         """
 
         if self.game.get_game_outcome() == GameOutcome.INCONCLUSIVE:
-
-            # Clear out already revealed / flagged cell(s).
-            self.to_reveal = [(r, c) for r, c in self.to_reveal if not self.game.is_revealed(r, c)]
-            self.to_flag = [(r, c) for r, c in self.to_flag if not self.game.is_revealed(r, c)]
-
-            # Use deduction systems to determine which cell(s) to flag / reveal.
-            if self.to_reveal == [] and self.to_flag == []:
-                self.basic_deduction()
-            if self.to_reveal == [] and self.to_flag == []:
-                self.complex_deduction()
-            if self.to_reveal == [] and self.to_flag == []:
-                self.random_decision()
+            self.deduce(printing=printing)
 
             # Reveal / flag chosen cell.
             if self.to_reveal:
@@ -56,6 +109,95 @@ class Bot:
                 r, c = self.to_flag.pop()
                 self.game.flag(r, c)
 
+    def deduce(self, printing=True):
+        """
+        Uses the deduction methods of this class, from the cheapest up, until at least one cell is queued in the
+        to_reveal or to_flag fields of this class, without making any move.
+
+        :param printing: A boolean parameter that determines whether a message is printed when the bot is forced to
+                         guess at random. Guesses from a probability table are recorded in the stats field instead.
+        """
+
+        if self.game.get_game_outcome() == GameOutcome.INCONCLUSIVE:
+            self.__cheap_deductions__()
+            if not self.has_queued_moves():
+                self.complex_deduction()
+            if not self.has_queued_moves():
+                self.random_decision(printing=printing)
+
+    def play_certain_moves(self):
+        """
+        Finds every move the deduction methods of this class are certain of, and applies them all to the game in a
+        single batch. Unlike take_action, the bot never guesses here, so no move is made if nothing is certain.
+
+        :return: A list of the moves made, each stored as a 2-tuple of the action ("reveal" or "flag") and the cell.
+        """
+
+        moves = []
+        if self.game.get_game_outcome() != GameOutcome.INCONCLUSIVE:
+            return moves
+
+        self.__cheap_deductions__()
+        if not self.has_queued_moves():
+            self.complex_deduction(certain_only=True)
+
+        for r, c in sorted(self.to_flag):
+            if not self.game.is_flagged(r, c):
+                self.game.flag(r, c)
+                if self.game.is_flagged(r, c):
+                    moves.append(("flag", (r, c)))
+        for r, c in sorted(self.to_reveal):
+            if self.game.get_game_outcome() != GameOutcome.INCONCLUSIVE:
+                break
+            if not self.game.is_revealed(r, c):
+                self.game.chain_reveal(r, c)
+                moves.append(("reveal", (r, c)))
+        self.to_flag.clear()
+        self.to_reveal.clear()
+        return moves
+
+    def play_until_guess(self):
+        """
+        Repeatedly applies every certain move (see play_certain_moves) until the game is over, or the bot would have to
+        guess to make progress.
+
+        :return: A list of the moves made, in the order they were made (see play_certain_moves).
+        """
+
+        moves = []
+        while True:
+            batch = self.play_certain_moves()
+            if not batch:
+                return moves
+            moves.extend(batch)
+
+    def __cheap_deductions__(self):
+        """
+        Runs basic and then linear deduction, unless a cell is already queued to be revealed or flagged, or they have
+        already found nothing in the current game state.
+        """
+
+        if self.has_queued_moves() or self.__exhausted_version__ == self.game.get_state_version():
+            return
+        self.basic_deduction()
+        if not self.has_queued_moves():
+            self.linear_deduction()
+        if not self.has_queued_moves():
+            self.__exhausted_version__ = self.game.get_state_version()
+
+    def has_queued_moves(self):
+        """
+        Clears out already revealed cell(s) from the to_reveal and to_flag fields of this class.
+
+        :return: Whether any cell is left to reveal or flag.
+        """
+
+        if self.to_reveal:
+            self.to_reveal.difference_update([cell for cell in self.to_reveal if self.game.is_revealed(*cell)])
+        if self.to_flag:
+            self.to_flag.difference_update([cell for cell in self.to_flag if self.game.is_revealed(*cell)])
+        return bool(self.to_reveal or self.to_flag)
+
     def random_decision(self, printing=True):
         """
         This method chooses a random unrevealed cell on the minesweeper game included in this class's fields. This cell
@@ -65,113 +207,210 @@ class Bot:
                          to the to_reveal field of this class.
         """
 
-        # Try to avoid revealing flagged cells.
-        reveal_cell_candidates = []
-        for r in range(self.game.get_rows()):
-            for c in range(self.game.get_columns()):
-                if not self.game.is_revealed(r, c) and not self.game.is_flagged(r, c):
-                    reveal_cell_candidates.append((r, c))
-
-        # If necessary, choose a reveal among flagged cells.
-        if not reveal_cell_candidates:
-            for r in range(self.game.get_rows()):
-                for c in range(self.game.get_columns()):
-                    if not self.game.is_revealed(r, c):
-                        reveal_cell_candidates.append((r, c))
-
-        reveal_cell = random.choice(reveal_cell_candidates)
+        # Try to avoid revealing flagged cells. Random cells are drawn until an unrevealed one turns up, which is quick
+        # unless most of the board is revealed, and works on boards far too large to scan.
+        reveal_cell = None
+        for _ in range(RANDOM_DECISION_TRIES):
+            cell = (random.randrange(self.game.get_rows()), random.randrange(self.game.get_columns()))
+            if not self.game.is_revealed(*cell) and not self.game.is_flagged(*cell):
+                reveal_cell = cell
+                break
+
+        # Otherwise scan the board, choosing a reveal among flagged cells if necessary.
+        if reveal_cell is None:
+            unrevealed = ~self.game.get_revealed_mask()
+            reveal_cell_candidates = np.argwhere(unrevealed & ~self.game.get_flagged_mask())
+            if len(reveal_cell_candidates) == 0:
+                reveal_cell_candidates = np.argwhere(unrevealed)
+            reveal_cell = tuple(random.choice(reveal_cell_candidates.tolist()))
+
+        self.guess_count += 1
+        if self.stats is not None:
+            self.stats.guesses += 1
+            self.stats.random_guesses += 1
         if printing:
             print("RANDOM DECISION MADE!")
-        self.to_reveal.append(reveal_cell)
+        self.to_reveal.add(reveal_cell)
 
     def basic_deduction(self):
         """
         This method looks at the current game state, and decides which cell(s), if any, to reveal and/or flag. This
-        decision is made by looking at all revealed (non-zero) numbered cells, and seeing if their individual number
+        decision is made by looking at revealed (non-zero) numbered cells, and seeing if their individual number
         guarantees a cell around them to be mines or not. It will not account for dependencies.
+
+        Only number cells next to a cell that was revealed, unrevealed, flagged or unflagged since the last call are
+        looked at, as the others cannot have changed their conclusions, so each call takes time proportional to the
+        changes rather than the board. Every cell deduced counts as flagged or revealed for the rest of the call, and
+        the number cells around it are looked at again, until no more cells are deduced.
+        """
+
+        for cell in self.__change_feed__:
+            self.__dirty_cells__.add(cell)
+            self.__dirty_cells__.update(self.game.get_surrounding_cells(*cell))
+        self.__change_feed__.clear()
+
+        mine_cells = set()
+        safe_cells = set()
+        queue = list(self.__dirty_cells__)
+        queued = set(queue)
+
+        # Number cells that deduced something stay dirty, so that their cells are found again if the queues are cleared
+        # before they are played.
+        self.__dirty_cells__ = set()
+        while queue:
+            n_cell = queue.pop()
+            queued.remove(n_cell)
+            if (not self.game.is_revealed(*n_cell) or self.game.is_mine(*n_cell) or
+                    self.game.get_surrounding_count(*n_cell) == 0):
+                continue
+
+            unknown_cells = []
+            known_mine_count = 0
+            for cell in self.game.get_surrounding_cells(*n_cell):
+                if self.game.is_flagged(*cell) or cell in mine_cells:
+                    known_mine_count += 1
+                elif not self.game.is_revealed(*cell) and cell not in safe_cells:
+                    unknown_cells.append(cell)
+            if not unknown_cells:
+                continue
+
+            # Either every unknown neighbour must be a mine, or every one must be safe.
+            surrounding_count = self.game.get_surrounding_count(*n_cell)
+            if surrounding_count == known_mine_count + len(unknown_cells):
+                mine_cells.update(unknown_cells)
+            elif surrounding_count == known_mine_count:
+                safe_cells.update(unknown_cells)
+            else:
+                continue
+            self.__dirty_cells__.add(n_cell)
+            for cell in unknown_cells:
+                for neighbour in self.game.get_surrounding_cells(*cell):
+                    if neighbour not in queued:
+                        queue.append(neighbour)
+                        queued.add(neighbour)
+
+        self.to_flag.update(mine_cells)
+        self.to_reveal.update(safe_cells)
+
+    def linear_deduction(self):
+        """
+        This method looks at the current game state, and decides which cell(s), if any, to reveal and/or flag. This
+        decision is made by comparing the constraints of pairs of overlapping number cells (see find_certain_cells),
+        which accounts for some dependencies while still running in polynomial time.
+        """
+
+        number_cells_border_neighbors, _, surrounding_mine_constraints = self.__frontier_constraints__()
+        safe_cells, mine_cells = find_certain_cells(number_cells_border_neighbors, surrounding_mine_constraints)
+        self.to_flag.update(mine_cells)
+        self.to_reveal.update(safe_cells)
+
+    def __frontier_constraints__(self):
+        """
+        :return: A 3-tuple of dictionaries. The first maps each number cell to a list of the unflagged unrevealed cells
+        around it, the second maps each of those border cells to a list of the number cells around it, and the third
+        maps each number cell to the number of surrounding mines not yet accounted for by flags.
         """
 
-        for n_r in range(self.game.get_rows()):
-            for n_c in range(self.game.get_columns()):
-                if (self.game.is_revealed(n_r, n_c) and self.game.get_surrounding_count(n_r, n_c) > 0 and
-                        not self.game.is_mine(n_r, n_c)):
-                    surrounding = 0
-                    surrounding_flagged = 0
-                    for b_r, b_c in self.game.get_surrounding_cells(n_r, n_c):
-                        if not self.game.is_revealed(b_r, b_c):
-                            surrounding += 1
-                            if self.game.is_flagged(b_r, b_c):
-                                surrounding_flagged += 1
-
-                    if surrounding == self.game.get_surrounding_count(n_r, n_c):
-                        for b_r, b_c in self.game.get_surrounding_cells(n_r, n_c):
-                            if (not self.game.is_revealed(b_r, b_c) and not self.game.is_flagged(b_r, b_c) and
-                                    (b_r, b_c) not in self.to_flag):
-                                self.to_flag.append((b_r, b_c))
-                    elif surrounding_flagged == self.game.get_surrounding_count(n_r, n_c):
-                        for b_r, b_c in self.game.get_surrounding_cells(n_r, n_c):
-                            if (not self.game.is_revealed(b_r, b_c) and not self.game.is_flagged(b_r, b_c) and
-                                    (b_r, b_c) not in self.to_reveal):
-                                self.to_reveal.append((b_r, b_c))
-
-    def complex_deduction(self, printing=True, certain_only=False):
+        # Every number cell of the frontier has a border cell around it, and there are usually far fewer border cells,
+        # so the constraints are built from the border cells' side.
+        number_cells = self.game.get_revealed_number_cells(include_flag_neighbours=False)
+        number_cells_border_neighbors = {n_cell: [] for n_cell in number_cells}
+        border_cells_number_neighbors = {}
+        surrounding_mine_constraints = {n_cell: self.game.get_surrounding_count(*n_cell) for n_cell in number_cells}
+        for b_cell in self.game.get_unrevealed_border_cells():
+            n_cells = [n_cell for n_cell in self.game.get_surrounding_cells(*b_cell)
+                       if n_cell in number_cells_border_neighbors]
+            if self.game.is_flagged(*b_cell):
+                for n_cell in n_cells:
+                    surrounding_mine_constraints[n_cell] -= 1
+            else:
+                border_cells_number_neighbors[b_cell] = n_cells
+                for n_cell in n_cells:
+                    number_cells_border_neighbors[n_cell].append(b_cell)
+        return number_cells_border_neighbors, border_cells_number_neighbors, surrounding_mine_constraints
+
+    def complex_deduction(self, certain_only=False):
         """
         This method looks at the current game state, and uses probability tables to decide which cell(s) to reveal
         and/or flag. If the probability tables yield any certain result, all those cell(s) are added to the to_revel or
-        to_flag fields of this class. Otherwise, the cell least probable to be a mine is added to the to_reveal field.
+        to_flag fields of this class. Otherwise, the cell least probable to be a mine is added to the to_reveal field,
+        and its chance of being safe is added to the guess_success_chance of the stats field, if set.
 
-        :param printing: A boolean value that represents whether to print a message notifying the user if a risk was
-                         taken in the current choice to cell to reveal. Here risk means a less than 100% probability
-                         that that cell to reveal is safe.
         :param certain_only: A boolean parameter that, if set to true, prevents this function from choosing cells to
                              reveal that are not 100% not a mine. If False, this function is guaranteed to make a
                              contribution to to_reveal or to_flag.
         """
 
-        probability_table = self.construct_probability_tables()
-        if 1.0 in probability_table.values() or 0.0 in probability_table.values():
-            for cell in probability_table.keys():
-                if probability_table[cell] == 1.0 and cell not in self.to_reveal:
-                    self.to_reveal.append(cell)
-                if probability_table[cell] == 0.0 and cell not in self.to_flag:
-                    self.to_flag.append(cell)
-        elif not certain_only:
+        # A search that found nothing certain is reused by the guess that follows it, if the game has not changed since.
+        if self.__table_version__ != self.game.get_state_version():
+            self.__table__ = self.construct_probability_tables()
+            self.__table_version__ = self.game.get_state_version()
+        probability_table = self.__table__
+
+        # Estimated probabilities are never treated as certain.
+        certain_cells = [cell for cell, probability in probability_table.items()
+                         if probability in (0.0, 1.0) and cell not in self.confidence_intervals]
+        if certain_cells:
+            for cell in certain_cells:
+                if probability_table[cell] == 1.0:
+                    self.to_reveal.add(cell)
+                if probability_table[cell] == 0.0:
+                    self.to_flag.add(cell)
+        elif not certain_only and probability_table:
             best_probability = probability_table[max(probability_table.keys(), key=probability_table.get)]
             best_guesses = [cell for cell in probability_table.keys() if probability_table[cell] == best_probability]
-            if printing:
-                print("GUESS WITH SUCCESS CHANCE", round(best_probability, 2))
             best_guess = random.choice(best_guesses)
-            self.to_reveal.append(best_guess)
+            self.guess_count += 1
+            if self.stats is not None:
+                self.stats.guesses += 1
+                self.stats.guess_success_chance += best_probability
+            self.to_reveal.add(best_guess)
 
-    def construct_probability_tables(self, digit_rounding=8):
+    def construct_probability_tables(self, digit_rounding=8, time_budget=None, node_budget=None):
         """
         For every unrevealed cell in the game, this function calculates and assigns a probability to that cell. This
         corresponds to the probability that that unrevealed cell is not a mine (not mine = 1, mine = 0). This is
-        calculated using only information available to the player.
+        calculated using only information available to the player. Islands that cannot be searched within the budgets
+        are estimated by random sampling, and recorded in the approximate_islands and confidence_intervals fields.
 
+        :param time_budget: The number of seconds to spend on exact island searches. Defaults to the time_budget field.
+        :param node_budget: The number of search nodes to visit per island. Defaults to the node_budget field.
         :return: A dictionary with keys as unrevealed cells (stored as 2-tuples) and values as floats between 0 and 1
         corresponding to the probability that that unrevealed cell is not a mine.
+        :raises ValueError: If the position contradicts itself, e.g. because of a wrong flag (see
+        combine_island_solutions).
         """
 
-        # STEP 1: Make the relevant data structures.
-        number_cells = self.game.get_revealed_number_cells(include_flag_neighbours=False)
-        border_cells = self.game.get_unrevealed_border_cells(include_flagged=False)
-        nonborder_cells = self.game.get_unrevealed_nonborder_cells()
-        number_cells_border_neighbors = {n_cell: [] for n_cell in number_cells}
-        border_cells_number_neighbors = {b_cell: [] for b_cell in border_cells}
-        for n_cell in number_cells:
-            n_r, n_c = n_cell
-            for b_cell in self.game.get_surrounding_cells(n_r, n_c):
-                if b_cell in border_cells_number_neighbors:
-                    number_cells_border_neighbors[n_cell].append(b_cell)
-        for b_cell in border_cells:
-            b_r, b_c = b_cell
-            for n_cell in self.game.get_surrounding_cells(b_r, b_c):
-                if n_cell in number_cells_border_neighbors:
-                    border_cells_number_neighbors[b_cell].append(n_cell)
-        unrevealed_cell_count = len(border_cells) + len(nonborder_cells)
+        if time_budget is None:
+            time_budget = self.time_budget
+        if node_budget is None:
+            node_budget = self.node_budget
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        call_stats = None if self.stats is None else SolverStats()
+        step_start = time.perf_counter()
+
+        # STEP 1: Make the relevant data structures, and settle the cells that linear deduction already decides so
+        # that the islands searched below are smaller.
+        number_cells_border_neighbors, border_cells_number_neighbors, surrounding_mine_constraints = \
+            self.__frontier_constraints__()
+        nonborder_cells = self.game.get_unrevealed_nonborder_cells(include_flagged=False)
+        nonborder_count = self.game.get_unrevealed_nonborder_count(include_flagged=False)
         remaining_mines = self.game.get_unused_flag_count()
 
+        safe_cells, mine_cells = find_certain_cells(number_cells_border_neighbors, surrounding_mine_constraints)
+        probability_dict = dict.fromkeys(safe_cells, 1.0)
+        probability_dict.update(dict.fromkeys(mine_cells, 0.0))
+        if probability_dict:
+            for n_cell, b_cells in number_cells_border_neighbors.items():
+                surrounding_mine_constraints[n_cell] -= len([1 for b_cell in b_cells if b_cell in mine_cells])
+                number_cells_border_neighbors[n_cell] = [b_cell for b_cell in b_cells if b_cell not in probability_dict]
+            for b_cell in probability_dict:
+                del border_cells_number_neighbors[b_cell]
+            remaining_mines -= len(mine_cells)
+        border_cells = tuple(border_cells_number_neighbors)
+        if call_stats is not None:
+            step_start = self.__end_step__(call_stats, 0, step_start)
+
         # Step 2: Split cells into dependant islands and reorder them.
         def manhattan_distance(cell1, cell2):
             return abs(cell1[0] - cell2[0]) + abs(cell1[1] - cell2[1])
@@ -204,128 +443,55 @@ class Bot:
 
         border_cell_islands.sort(key=len)
         border_cell_islands = tuple(border_cell_islands)
+        if call_stats is not None:
+            step_start = self.__end_step__(call_stats, 1, step_start)
 
         # Step 3: Calculate mine arrangement possibilities.
-        surrounding_mine_constraints = {(n_r, n_c): self.game.get_surrounding_count(n_r, n_c) -
-                                        len([1 for b_r, b_c in self.game.get_surrounding_cells(n_r, n_c)
-                                             if not self.game.is_revealed(b_r, b_c) and self.game.is_flagged(b_r, b_c)])
-                                        for n_r, n_c in number_cells}
-        surrounding_unknown_constraints = {n_cell: len(number_cells_border_neighbors[n_cell])
-                                           for n_cell in number_cells}
-
-        def get_solution_arrays(border_cell_group, surrounding_mine_constraints, surrounding_unknown_constraints,
-                                current_solution, solutions, mines_used=0):
-            """
-            This is a recursive searching function designed to find all possible underlying solutions to a group of
-            unrevealed cells in a minesweeper grid.
-
-            :param border_cell_group: An iterable of integer 2-tuples corresponding to a group of border cells in a
-            minesweeper game.
-            :param surrounding_mine_constraints: A dictionary with keys of integer 2-tuples corresponding to
-            non-zero revealed cells in a minesweeper game. The values represent the number of surrounding mines, but
-            unlike the value on the game grid, these dynamically update during simulation.
-            :param surrounding_unknown_constraints: A dictionary with keys of integer 2-tuples corresponding to
-            non-zero revealed cells in a minesweeper game. The values represent the number of surrounding cells who's
-            mine/not mine status is not yet known. Unlike the values obtainable from the game grid,these dynamically
-            update during simulation.
-            :param current_solution: A list of boolean values corresponding to whether or not a particular cell is a
-            mine or not. Indexes from the solution correspond to the cell at that index from border_cell_group. This
-            parameter is dynamic, and frequently modified to go through all solution possibilities.
-            :param solutions: A list of lists of boolean values corresponding to whether or not a particular cell is a
-            mine or not. Indexes from the solution correspond to the cell at that index from border_cell_group. These
-            lists correspond to mine arrangements that are consistent with the provided game constraints. This
-            parameter is dynamic, it starts out empty and solutions are appended to it throughout the recursion.
-            :param mines_used: An integer counting the number of mines currently assumed present in the simulation.
-            """
-
-            if len(current_solution) == len(border_cell_group):
-                solutions.append(current_solution.copy())
-            else:
-                b_cell = tuple(border_cell_group[len(current_solution)])
-                for b_cell_status in (MINE, NOT_MINE):
-
-                    current_solution.append(b_cell_status)
-                    go_deeper = True
-                    for n_cell in border_cells_number_neighbors[b_cell]:
-                        surrounding_unknown_constraints[n_cell] -= 1
-                        if b_cell_status == MINE:
-                            surrounding_mine_constraints[n_cell] -= 1
-                        if (surrounding_unknown_constraints[n_cell] < surrounding_mine_constraints[n_cell] or
-                                surrounding_mine_constraints[n_cell] < 0):
-                            go_deeper = False
-                    if b_cell_status == MINE:
-                        mines_used += 1
-                    if mines_used > remaining_mines:
-                        go_deeper = False
-
-                    if go_deeper:
-                        get_solution_arrays(border_cell_group, surrounding_mine_constraints,
-                                            surrounding_unknown_constraints, current_solution, solutions, mines_used)
-
-                    if b_cell_status == MINE:
-                        mines_used -= 1
-                    for n_cell in border_cells_number_neighbors[b_cell]:
-                        surrounding_unknown_constraints[n_cell] += 1
-                        if b_cell_status == MINE:
-                            surrounding_mine_constraints[n_cell] += 1
-                    current_solution.pop()
-
-        island_solutions = []
-        for i, border_cell_island in enumerate(border_cell_islands):
-            solutions = []
-            get_solution_arrays(np.array(border_cell_island), surrounding_mine_constraints,
-                                surrounding_unknown_constraints, current_solution=[], solutions=solutions)
-            island_solutions.append(solutions)
-
-        # Step 4: Construct probability tables for border cells.
-        most_island_solutions = 0
-        if island_solutions:
-            most_island_solutions = max([len(island_solution) for island_solution in island_solutions])
-        island_solution_likelihoods = np.zeros((len(island_solutions), most_island_solutions))
-
-        for i, solutions in enumerate(island_solutions):
-            for s, solution in enumerate(solutions):
-                island_solution_likelihoods[i][s] = 1.0
-                temp_remaining_mines = remaining_mines
-                temp_unrevealed_cell_count = unrevealed_cell_count
-                for k in solution:
-                    if k == NOT_MINE:
-                        island_solution_likelihoods[i][s] *= ((temp_unrevealed_cell_count - temp_remaining_mines) /
-                                                              temp_unrevealed_cell_count)
-                    elif k == MINE:
-                        island_solution_likelihoods[i][s] *= temp_remaining_mines / temp_unrevealed_cell_count
-                        temp_remaining_mines -= 1
-                    temp_unrevealed_cell_count -= 1
-
-        probability_dict = {}
-        for i, solutions in enumerate(island_solutions):
-            normalizer_constant = sum(island_solution_likelihoods[i])
-            for j, b_cell in enumerate(border_cell_islands[i]):
-                probability_dict[b_cell] = sum([island_solution_likelihoods[i][s] for s, solution in
-                                                enumerate(solutions) if solution[j] == NOT_MINE])
-                probability_dict[b_cell] /= normalizer_constant
-                probability_dict[b_cell] = round(probability_dict[b_cell], digit_rounding)
+        surrounding_unknown_constraints = {n_cell: len(b_cells)
+                                           for n_cell, b_cells in number_cells_border_neighbors.items()}
+
+        island_solutions = solve_islands(border_cell_islands, border_cells_number_neighbors,
+                                         surrounding_mine_constraints, surrounding_unknown_constraints,
+                                         remaining_mines, self.island_cache, self.island_executor,
+                                         self.inline_island_size, node_budget, deadline, stats=call_stats,
+                                         count_solutions=self.solver_backend)
+        if call_stats is not None:
+            step_start = self.__end_step__(call_stats, 2, step_start)
+
+        # Step 4: Combine the islands' arrangement counts, weighting each global arrangement of border mines by the
+        # number of ways to place the remaining mines among the non-border cells.
+        self.approximate_islands = [island_solution.island for island_solution in island_solutions
+                                    if island_solution.is_approximate()]
+        self.confidence_intervals = {}
+        border_probabilities, nb_probability = combine_island_solutions(island_solutions, remaining_mines,
+                                                                        nonborder_count, self.confidence_intervals,
+                                                                        self.exact_weights, call_stats)
+        for b_cell, probability in border_probabilities.items():
+            probability_dict[b_cell] = round(probability, digit_rounding)
+        if call_stats is not None:
+            step_start = self.__end_step__(call_stats, 3, step_start)
 
         # Step 5: Add non-border cell's probabilities to probability table.
         if len(nonborder_cells) > 0:
-            island_mine_amounts = [tuple(set([sum(s) for s in solutions])) for solutions in island_solutions]
-            island_mine_amount_probabilities = [{mine_amount: sum([1 for s in solutions if sum(s) == mine_amount]) /
-                                                 len(solutions) for mine_amount in island_mine_amounts[i]}
-                                                for i, solutions in enumerate(island_solutions)]
-            normalizer_constant = 0
-            average_border_mine_amount = 0
-            for comb in itertools.product(*island_mine_amounts):
-                if sum(comb) <= remaining_mines and remaining_mines - sum(comb) <= len(nonborder_cells):
-                    comb_probability = 1
-                    for i, num in enumerate(comb):
-                        comb_probability *= island_mine_amount_probabilities[i][num]
-                    normalizer_constant += comb_probability
-                    average_border_mine_amount += comb_probability * sum(comb)
-            average_border_mine_amount /= normalizer_constant
-
-            nb_probability = 1 - (remaining_mines - average_border_mine_amount) / len(nonborder_cells)
             nb_probability = round(nb_probability, digit_rounding)
             for nb_cell in nonborder_cells:
                 probability_dict[nb_cell] = nb_probability
+        if call_stats is not None:
+            self.__end_step__(call_stats, 4, step_start)
+            call_stats.calls = 1
+            self.last_table_stats = call_stats
+            self.stats.add(call_stats)
 
         return probability_dict
+
+    @staticmethod
+    def __end_step__(call_stats, step, step_start):
+        """
+        Adds the time since step_start to the time of a step of construct_probability_tables.
+
+        :return: The current time, which the next step starts at.
+        """
+
+        step_end = time.perf_counter()
+        call_stats.step_times[step] += step_end - step_start
+        return step_end
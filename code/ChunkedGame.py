@@ -0,0 +1,245 @@
+from GameStructures import *
+
+
+# The side length of the square chunks that the boards of chunked games are stored in.
+CHUNK_SIZE = 64
+
+
+class ChunkedGrid:
+    """
+    A 2D grid indexed like a numpy array with (row, column) tuples, stored as square chunks that are only allocated
+    when first written to. Reading an unallocated chunk gives zero, unless the grid has a chunk factory, in which case
+    the chunk is made by the factory on first read and kept.
+
+    :ivar dtype: The numpy dtype of the grid's values.
+    :type dtype: numpy.dtype
+    :ivar chunk_size: The side length of every chunk.
+    :type chunk_size: int
+    """
+
+    def __init__(self, dtype, chunk_size=CHUNK_SIZE, make_chunk=None):
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.__zero__ = self.dtype.type(0)
+        self.__zero_chunk__ = np.zeros((chunk_size, chunk_size), dtype=self.dtype)
+        self.__zero_chunk__.flags.writeable = False
+        self.__make_chunk__ = make_chunk
+        self.__chunks__ = {}
+
+    def __getitem__(self, cell):
+        row, column = cell
+        chunk = self.__chunks__.get((row // self.chunk_size, column // self.chunk_size))
+        if chunk is None:
+            if self.__make_chunk__ is None:
+                return self.__zero__
+            chunk = self.get_chunk(row // self.chunk_size, column // self.chunk_size)
+        return chunk[row % self.chunk_size, column % self.chunk_size]
+
+    def __setitem__(self, cell, value):
+        row, column = cell
+        self.get_chunk(row // self.chunk_size, column // self.chunk_size)[row % self.chunk_size,
+                                                                          column % self.chunk_size] = value
+
+    def __copy__(self):
+        duplicate = ChunkedGrid(self.dtype, self.chunk_size, self.__make_chunk__)
+        duplicate.__chunks__ = {key: chunk.copy() for key, chunk in self.__chunks__.items()}
+        return duplicate
+
+    def get_chunk(self, chunk_row, chunk_column):
+        """
+        :return: The (writeable) array of a chunk, allocating it if necessary.
+        """
+
+        chunk = self.__chunks__.get((chunk_row, chunk_column))
+        if chunk is None:
+            if self.__make_chunk__ is None:
+                chunk = np.zeros((self.chunk_size, self.chunk_size), dtype=self.dtype)
+            else:
+                chunk = self.__make_chunk__(chunk_row, chunk_column)
+            self.__chunks__[(chunk_row, chunk_column)] = chunk
+        return chunk
+
+    def read_chunk(self, chunk_row, chunk_column):
+        """
+        :return: The array of a chunk, which must not be written to. An unallocated chunk is not allocated, unless the
+        grid has a chunk factory.
+        """
+
+        chunk = self.__chunks__.get((chunk_row, chunk_column))
+        if chunk is None:
+            return self.__zero_chunk__ if self.__make_chunk__ is None else self.get_chunk(chunk_row, chunk_column)
+        return chunk
+
+    def get_chunk_keys(self):
+        return set(self.__chunks__)
+
+    def to_array(self, rows, columns):
+        """
+        :return: The top left rows x columns of the grid as a single numpy array. Every chunk of that area is made if
+        the grid has a chunk factory, so this is only practical for grids of a modest size.
+        """
+
+        size = self.chunk_size
+        grid = np.zeros((rows, columns), dtype=self.dtype)
+        if self.__make_chunk__ is None:
+            keys = [key for key in self.__chunks__ if key[0] * size < rows and key[1] * size < columns]
+        else:
+            keys = [(chunk_row, chunk_column) for chunk_row in range(-(-rows // size))
+                    for chunk_column in range(-(-columns // size))]
+        for chunk_row, chunk_column in keys:
+            block = grid[chunk_row * size:(chunk_row + 1) * size, chunk_column * size:(chunk_column + 1) * size]
+            block[...] = self.read_chunk(chunk_row, chunk_column)[:block.shape[0], :block.shape[1]]
+        return grid
+
+
+class ChunkedGame(Game):
+    """
+    A game on a board stored in chunks (see ChunkedGrid), for boards far too large to hold in memory, like 100k x 100k
+    cells. Only the chunks around the explored part of the board are ever allocated. The mines of each chunk are drawn
+    when it is first needed, from a random generator seeded by the game's seed and the chunk's coordinates, so they do
+    not depend on the order the board is explored in.
+
+    Every chunk holds the same density of mines, rounded to a whole number of mines per chunk, so the total mine count
+    is known up front. It has the same interface as Game, except that get_unrevealed_nonborder_cells only gives the
+    cells of the chunks explored so far, and that the whole-board bulk getters build full size arrays, so they should
+    not be used on large boards. Forks and snapshots copy the explored chunks rather than sharing them.
+    """
+
+    def __init__(self, rows, columns, mine_density, seed=None, chunk_size=CHUNK_SIZE):
+
+        # Record basic game parameters. The state below is that of Game, with every grid stored in chunks.
+        self.__rows__ = rows
+        self.__columns__ = columns
+        self.__mine_density__ = mine_density
+        self.__chunk_size__ = chunk_size
+        self.__mine_count__ = self.__total_mine_count__()
+
+        self.__revealed_cell_count__ = 0
+        self.__revealed_mine_count__ = 0
+        self.__game_outcome__ = GameOutcome.INCONCLUSIVE
+        self.__unused_flag_count__ = self.__mine_count__
+        self.__state_version__ = 0
+        self.__change_feeds__ = []
+
+        self.__revealed__ = ChunkedGrid(bool, chunk_size)
+        self.__flagged__ = ChunkedGrid(bool, chunk_size)
+
+        self.__move_log__ = array.array("q")
+        self.__move_starts__ = array.array("q")
+        self.__state_owners__ = [1]
+
+        self.__number_cells__ = set()
+        self.__frontier_cells__ = set()
+        self.__border_cells__ = set()
+        self.__border_counts__ = ChunkedGrid(np.uint8, chunk_size)
+        self.__closed_counts__ = ChunkedGrid(np.uint8, chunk_size)
+
+        # The mines and surrounding counts are fixed by the seed, so their chunks are made on demand and shared by every
+        # fork and snapshot.
+        self.__mine_seed__ = random.getrandbits(64) if seed is None else seed
+        self.__mines_placed__ = True
+        self.__mines__ = ChunkedGrid(bool, chunk_size, self.__make_mine_chunk__)
+        self.__surrounding_counts__ = ChunkedGrid(np.uint8, chunk_size, self.__make_count_chunk__)
+
+        # The openings of a board that is never fully made cannot be found up front, so chain reveals flood cell by
+        # cell, and are undone cell by cell.
+        self.__opening_labels__ = None
+        self.__opening_bounds__ = None
+
+    def __chunk_shape__(self, chunk_row, chunk_column):
+        # The part of a chunk that lies on the board.
+        size = self.__chunk_size__
+        return (max(0, min(size, self.__rows__ - chunk_row * size)),
+                max(0, min(size, self.__columns__ - chunk_column * size)))
+
+    def __chunk_mine_count__(self, height, width):
+        return int(self.__mine_density__ * height * width + 0.5)
+
+    def __total_mine_count__(self):
+        # Chunks are full, or cut short by the bottom and / or right edge of the board.
+        size = self.__chunk_size__
+        full_rows, last_rows = divmod(self.__rows__, size)
+        full_columns, last_columns = divmod(self.__columns__, size)
+        return sum(chunk_rows * chunk_columns * self.__chunk_mine_count__(height, width)
+                   for chunk_rows, height in ((full_rows, size), (int(last_rows > 0), last_rows))
+                   for chunk_columns, width in ((full_columns, size), (int(last_columns > 0), last_columns)))
+
+    def __make_mine_chunk__(self, chunk_row, chunk_column):
+        mines = np.zeros((self.__chunk_size__, self.__chunk_size__), dtype=bool)
+        height, width = self.__chunk_shape__(chunk_row, chunk_column)
+        if chunk_row >= 0 and chunk_column >= 0 and height > 0 and width > 0:
+            rng = np.random.default_rng([self.__mine_seed__, chunk_row, chunk_column])
+            mine_indices = rng.choice(height * width, self.__chunk_mine_count__(height, width), replace=False)
+            mines[:height, :width].flat[mine_indices] = True
+        return mines
+
+    def __make_count_chunk__(self, chunk_row, chunk_column):
+        # Count over the chunk and its 8 neighbouring chunks, so that mines across the chunk's edges are included.
+        size = self.__chunk_size__
+        neighbourhood = np.block([[self.__mines__.read_chunk(chunk_row + row_offset, chunk_column + column_offset)
+                                   for column_offset in (-1, 0, 1)] for row_offset in (-1, 0, 1)])
+        return count_neighbours(neighbourhood)[size:2 * size, size:2 * size].copy()
+
+    def __explored_chunks__(self):
+        return sorted(self.__revealed__.get_chunk_keys() | self.__flagged__.get_chunk_keys() |
+                      self.__border_counts__.get_chunk_keys())
+
+    def __changed_cells__(self, snapshot):
+        size = self.__chunk_size__
+        changed = []
+        chunk_keys = set(self.__explored_chunks__())
+        chunk_keys |= snapshot["__revealed__"].get_chunk_keys() | snapshot["__flagged__"].get_chunk_keys()
+        for chunk_row, chunk_column in sorted(chunk_keys):
+            changed_mask = np.zeros((size, size), dtype=bool)
+            for name in ("__revealed__", "__flagged__"):
+                changed_mask |= (getattr(self, name).read_chunk(chunk_row, chunk_column) !=
+                                 snapshot[name].read_chunk(chunk_row, chunk_column))
+            changed.extend((chunk_row * size + row, chunk_column * size + column)
+                           for row, column in self.__cells__(changed_mask))
+        return changed
+
+    def __undo_entries__(self, start, end):
+        for entry in reversed(self.__move_log__[start:end]):
+            self.__undo_entry__(entry)
+
+    def get_chunk_size(self):
+        return self.__chunk_size__
+
+    def get_explored_chunk_count(self):
+        return len(self.__explored_chunks__())
+
+    # Bulk getters, built from the chunks.
+    def get_revealed_mask(self):
+        return self.__read_only__(self.__revealed__.to_array(self.__rows__, self.__columns__))
+
+    def get_flagged_mask(self):
+        return self.__read_only__(self.__flagged__.to_array(self.__rows__, self.__columns__))
+
+    def get_mine_mask(self):
+        mines = self.__mines__.to_array(self.__rows__, self.__columns__)
+        if self.__game_outcome__ != GameOutcome.INCONCLUSIVE:
+            return self.__read_only__(mines)
+        return self.__read_only__(mines & self.__revealed__.to_array(self.__rows__, self.__columns__))
+
+    def get_surrounding_count_grid(self):
+        surrounding_counts = self.__surrounding_counts__.to_array(self.__rows__, self.__columns__)
+        if self.__game_outcome__ != GameOutcome.INCONCLUSIVE:
+            return self.__read_only__(surrounding_counts)
+        revealed = self.__revealed__.to_array(self.__rows__, self.__columns__)
+        return self.__read_only__(np.where(revealed, surrounding_counts, np.uint8(0)))
+
+    def get_unrevealed_nonborder_cells(self, include_flagged=True):
+        # Only the cells of explored chunks, as the rest of the board may be too large to list.
+        size = self.__chunk_size__
+        cells = []
+        for chunk_row, chunk_column in self.__explored_chunks__():
+            nonborder_mask = (~self.__revealed__.read_chunk(chunk_row, chunk_column) &
+                              (self.__border_counts__.read_chunk(chunk_row, chunk_column) == 0))
+            if not include_flagged:
+                nonborder_mask &= ~self.__flagged__.read_chunk(chunk_row, chunk_column)
+            height, width = self.__chunk_shape__(chunk_row, chunk_column)
+            nonborder_mask[height:] = False
+            nonborder_mask[:, width:] = False
+            cells.extend((chunk_row * size + row, chunk_column * size + column)
+                         for row, column in self.__cells__(nonborder_mask))
+        return tuple(cells)
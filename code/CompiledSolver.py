@@ -0,0 +1,193 @@
+import time
+
+from IslandSolver import *
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# States of a search node in the kernel's explicit stack: not yet expanded, searching its mine branch, or searching its
+# no mine branch.
+FRESH = 0
+MINE_BRANCH = 1
+SAFE_BRANCH = 2
+
+# Number of search nodes the kernel visits between checks of the deadline.
+KERNEL_SLICE_NODES = 1 << 16
+
+
+def jit(function):
+    # Compiled to machine code when numba is installed, and cached on disk between runs. Otherwise the kernel runs as
+    # plain Python, which gives the same results, only slowly.
+    if numba is None:
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+@jit
+def search_kernel(constraint_starts, constraint_indices, order, mines_needed, unknowns_left, max_mines, choices, state,
+                  solution_counts, cell_mine_counts, node_limit):
+    """
+    The backtracking search of count_island_solutions, made iterative over flat arrays so that it can be compiled. The
+    search can be stopped and resumed: the recursion stack is held in choices, and the depth, mines used and nodes
+    visited in state, so a call picks up where the last one stopped.
+
+    :param constraint_starts: The constraints of the cell searched at depth d are those in constraint_indices from
+                              constraint_starts[d] up to constraint_starts[d + 1].
+    :param constraint_indices: The constraint indices of every cell, in search order.
+    :param order: The index in the island of the cell searched at each depth.
+    :param mines_needed: The mines each constraint still needs.
+    :param unknowns_left: The unknown cells each constraint has left.
+    :param max_mines: The largest number of mines an arrangement may use.
+    :param choices: The state (FRESH, MINE_BRANCH or SAFE_BRANCH) of the search node at each depth.
+    :param state: The depth, mines used and nodes visited so far.
+    :param solution_counts: The arrangement counts by mine amount, added to.
+    :param cell_mine_counts: The arrangement counts by mine amount and cell, added to.
+    :param node_limit: The number of nodes visited at which to stop.
+    :return: Whether the search finished, rather than stopping at the node limit.
+    """
+
+    island_size = order.shape[0]
+    depth = state[0]
+    mines_used = state[1]
+    nodes_visited = state[2]
+    while depth >= 0:
+        choice = choices[depth]
+        if choice == FRESH:
+            if nodes_visited >= node_limit:
+                state[0] = depth
+                state[1] = mines_used
+                state[2] = nodes_visited
+                return False
+            nodes_visited += 1
+
+            if depth == island_size:
+                solution_counts[mines_used] += 1
+                for d in range(island_size):
+                    if choices[d] == MINE_BRANCH:
+                        cell_mine_counts[mines_used, order[d]] += 1
+                depth -= 1
+                continue
+
+        start = constraint_starts[depth]
+        end = constraint_starts[depth + 1]
+        if choice == FRESH:
+            # Try a mine, which every constraint of the cell must still need and have room for.
+            feasible = mines_used < max_mines
+            for i in range(start, end):
+                k = constraint_indices[i]
+                if not 0 < mines_needed[k] <= unknowns_left[k]:
+                    feasible = False
+                    break
+            if feasible:
+                for i in range(start, end):
+                    mines_needed[constraint_indices[i]] -= 1
+                    unknowns_left[constraint_indices[i]] -= 1
+                mines_used += 1
+                choices[depth] = MINE_BRANCH
+                depth += 1
+                choices[depth] = FRESH
+                continue
+        elif choice == MINE_BRANCH:
+            for i in range(start, end):
+                mines_needed[constraint_indices[i]] += 1
+                unknowns_left[constraint_indices[i]] += 1
+            mines_used -= 1
+        else:
+            for i in range(start, end):
+                unknowns_left[constraint_indices[i]] += 1
+            depth -= 1
+            continue
+
+        # Try no mine, which needs every constraint of the cell to have enough other unknown cells left.
+        feasible = True
+        for i in range(start, end):
+            k = constraint_indices[i]
+            if not 0 <= mines_needed[k] < unknowns_left[k]:
+                feasible = False
+                break
+        if feasible:
+            for i in range(start, end):
+                unknowns_left[constraint_indices[i]] -= 1
+            choices[depth] = SAFE_BRANCH
+            depth += 1
+            choices[depth] = FRESH
+            continue
+        depth -= 1
+
+    state[0] = depth
+    state[1] = mines_used
+    state[2] = nodes_visited
+    return True
+
+
+def count_island_solutions_compiled(border_cell_island, border_cells_number_neighbors, surrounding_mine_constraints,
+                                    surrounding_unknown_constraints, max_mines, node_budget=None, deadline=None):
+    """
+    Counts an island's arrangements exactly like count_island_solutions, and takes the same arguments, but searches
+    with search_kernel, which is compiled when numba is installed. The counts, and the number of nodes visited, are
+    identical.
+
+    :return: An IslandSolution holding the counts.
+    :raises SearchBudgetExceeded: If the node budget or deadline is exceeded before the search finishes.
+    """
+
+    island, mines_needed, unknowns_left, cell_constraints = index_island_constraints(
+        border_cell_island, border_cells_number_neighbors, surrounding_mine_constraints,
+        surrounding_unknown_constraints)
+    order = order_island_cells(cell_constraints)
+    island_size = len(island)
+
+    constraint_starts = np.zeros(island_size + 1, dtype=np.int64)
+    constraint_starts[1:] = np.cumsum([len(cell_constraints[j]) for j in order])
+    constraint_indices = np.array([k for j in order for k in cell_constraints[j]], dtype=np.int64)
+    order = np.array(order, dtype=np.int64)
+    mines_needed = np.array(mines_needed, dtype=np.int64)
+    unknowns_left = np.array(unknowns_left, dtype=np.int64)
+    choices = np.zeros(island_size + 1, dtype=np.int8)
+    state = np.zeros(3, dtype=np.int64)
+    solution_counts = np.zeros(island_size + 1, dtype=np.int64)
+    cell_mine_counts = np.zeros((island_size + 1, island_size), dtype=np.int64)
+
+    # The node budget is enforced by the kernel, and the deadline between slices of the search.
+    node_limit = np.iinfo(np.int64).max if node_budget is None else node_budget
+    while True:
+        slice_limit = node_limit if deadline is None else min(node_limit, int(state[2]) + KERNEL_SLICE_NODES)
+        if search_kernel(constraint_starts, constraint_indices, order, mines_needed, unknowns_left, max_mines, choices,
+                         state, solution_counts, cell_mine_counts, slice_limit):
+            break
+        if state[2] >= node_limit or (deadline is not None and time.monotonic() > deadline):
+            raise SearchBudgetExceeded()
+
+    island_solution = IslandSolution(island, solution_counts.tolist(), cell_mine_counts.tolist())
+    island_solution.nodes_visited = int(state[2])
+    return island_solution
+
+
+# Solver backends by name. Every backend counts an island's arrangements like count_island_solutions.
+SOLVER_BACKENDS = {"python": count_island_solutions,
+                   "compiled": count_island_solutions_compiled}
+
+
+def default_solver_backend():
+    """
+    :return: The compiled backend if numba is installed, as it is much faster, or else the pure Python one.
+    """
+
+    return count_island_solutions_compiled if numba is not None else count_island_solutions
+
+
+def warm_up_compiled_solver():
+    """
+    Compiles search_kernel, or loads it from numba's on-disk cache, by solving a tiny island. Otherwise this cost is
+    paid by the first island solved with the compiled backend.
+
+    :return: The number of seconds it took.
+    """
+
+    start = time.perf_counter()
+    count_island_solutions_compiled([(0, 0), (0, 1)], {(0, 0): [(1, 0)], (0, 1): [(1, 0)]}, {(1, 0): 1}, {(1, 0): 2},
+                                    2)
+    return time.perf_counter() - start
@@ -1,15 +1,127 @@
+import array
+import copy
 import enum
 import random
 import numpy as np
 
 
-class Cell:
-
-    def __init__(self, revealed=False, mine=False, flagged=False, surrounding_count=0):
-        self.revealed = revealed
-        self.mine = mine
-        self.flagged = flagged
-        self.surrounding_count = surrounding_count
+# Kinds of move log entry. Each entry stores the flat index of a cell shifted left by two bits, ORed with its kind. An
+# opening entry stores the label of an opening whose zero cells were revealed together instead (see
+# Game.__reveal_opening__).
+REVEAL_ENTRY = 0
+FLAG_ENTRY = 1
+UNFLAG_ENTRY = 2
+OPENING_ENTRY = 3
+
+# The containers that make up the mutable state of a game. Forks and snapshots of a game share them until either side
+# changes them (copy-on-write).
+COPY_ON_WRITE_STATE = ("__revealed__", "__flagged__", "__border_counts__", "__closed_counts__", "__number_cells__",
+                       "__frontier_cells__", "__border_cells__", "__move_log__", "__move_starts__")
+
+
+def count_neighbours(mask):
+    """
+    Counts, for every cell of a 2D grid, how many of its (up to 8) surrounding cells are set in the given mask.
+
+    :param mask: A 2D boolean (or integer 0/1) numpy array.
+    :return: A 2D uint8 numpy array of the same shape holding the neighbour counts.
+    """
+
+    # The 3x3 box sum is separable, so sum each column of three cells, then each row of three column sums.
+    mask = mask.astype(np.uint8)
+    padded = np.pad(mask, 1)
+    column_sums = padded[:-2] + padded[1:-1] + padded[2:]
+    return column_sums[:, :-2] + column_sums[:, 1:-1] + column_sums[:, 2:] - mask
+
+
+def label_regions(mask):
+    """
+    Labels the 8-connected regions of a 2D mask, e.g. the zero regions of a board, whose cells all open together. The
+    mask is split into horizontal runs of cells, runs in adjacent rows that touch are linked, and the linked runs are
+    joined by repeatedly hooking the root of every link's larger end onto the smaller one, then pointing every run
+    straight at its root. The work is linear in the board size and the number of runs, whatever the shape of the
+    regions.
+
+    :param mask: A 2D boolean numpy array.
+    :return: A 2-tuple of a 2D integer numpy array of the same shape, holding the index of each cell's region, or -1 for
+    cells not in the mask, and a region count x 4 int64 numpy array of the top, left, bottom and right of each region's
+    bounding box, the bottom and right being exclusive.
+    """
+
+    # Runs of the mask in row-major order, with exclusive ends.
+    rows, columns = mask.shape
+    starts = mask.copy()
+    starts[:, 1:] &= ~mask[:, :-1]
+    ends = mask.copy()
+    ends[:, :-1] &= ~mask[:, 1:]
+    run_rows, run_starts = np.nonzero(starts)
+    run_ends = np.nonzero(ends)[1] + 1
+
+    # Link every run to the runs of the row above that touch it, including diagonally. Those are the runs of that row
+    # that end at or after its start and start at or before its end, which are consecutive in row-major order.
+    width = columns + 2
+    first_links = np.searchsorted(run_rows * width + run_ends, (run_rows - 1) * width + run_starts, side="left")
+    last_links = np.searchsorted(run_rows * width + run_starts, (run_rows - 1) * width + run_ends, side="right")
+    link_counts = np.maximum(last_links - first_links, 0)
+    link_offsets = np.arange(int(link_counts.sum())) - np.repeat(np.cumsum(link_counts) - link_counts, link_counts)
+    lower_runs = np.repeat(np.arange(run_rows.size), link_counts)
+    upper_runs = np.repeat(first_links, link_counts) + link_offsets
+
+    # Every run points at a run no later than itself, and roots at themselves.
+    parents = np.arange(run_rows.size)
+    while True:
+        upper_roots, lower_roots = parents[upper_runs], parents[lower_runs]
+        unjoined = upper_roots != lower_roots
+        if not unjoined.any():
+            break
+        np.minimum.at(parents, np.maximum(upper_roots, lower_roots)[unjoined],
+                      np.minimum(upper_roots, lower_roots)[unjoined])
+        while True:
+            grandparents = parents[parents]
+            if np.array_equal(grandparents, parents):
+                break
+            parents = grandparents
+
+    # Number the regions from 0 in order of their first run, and find their bounding boxes.
+    roots = parents == np.arange(run_rows.size)
+    root_runs = np.flatnonzero(roots)
+    regions = (np.cumsum(roots) - 1)[parents]
+    dtype = np.int32 if rows * columns < 2 ** 31 else np.int64
+    labels = np.full((rows, columns), -1, dtype=dtype)
+    labels[mask] = np.repeat(regions, run_ends - run_starts)
+    bounds = np.empty((root_runs.size, 4), dtype=np.int64)
+    bounds[:, 0] = run_rows[root_runs]
+    bounds[:, 1] = columns
+    np.minimum.at(bounds[:, 1], regions, run_starts)
+    bounds[:, 2] = 0
+    np.maximum.at(bounds[:, 2], regions, run_rows + 1)
+    bounds[:, 3] = 0
+    np.maximum.at(bounds[:, 3], regions, run_ends)
+    return labels, bounds
+
+
+def generate_mine_mask(rows, columns, mine_count, seed=None, safe_mask=None):
+    """
+    Places mines uniformly at random on a grid.
+
+    :param rows: The number of rows of the grid.
+    :param columns: The number of columns of the grid.
+    :param mine_count: The number of mines to place.
+    :param seed: An optional seed. The same seed always gives the same mines. If None, the seed is drawn from the
+                 global random state.
+    :param safe_mask: An optional 2D boolean numpy array of cells to keep free of mines.
+    :return: A 2D boolean numpy array that is True where there is a mine.
+    """
+
+    # Boards come from numpy's generator, so they are independent of a global random state seeded the same.
+    rng = np.random.default_rng(random.getrandbits(64) if seed is None else seed)
+    mines = np.zeros((rows, columns), dtype=bool)
+    if safe_mask is None:
+        mines.flat[rng.choice(rows*columns, mine_count, replace=False)] = True
+    else:
+        candidates = np.flatnonzero(~safe_mask)
+        mines.flat[candidates[rng.choice(candidates.size, mine_count, replace=False)]] = True
+    return mines
 
 
 class GameOutcome(enum.Enum):
@@ -20,7 +132,7 @@ class GameOutcome(enum.Enum):
 
 class Game:
 
-    def __init__(self, rows, columns, mine_count):
+    def __init__(self, rows, columns, mine_count, seed=None, first_click_safe=False):
 
         # Record basic game parameters.
         self.__rows__ = rows
@@ -28,26 +140,113 @@ class Game:
         self.__mine_count__ = mine_count
 
         self.__revealed_cell_count__ = 0
+        self.__revealed_mine_count__ = 0
         self.__game_outcome__ = GameOutcome.INCONCLUSIVE
         self.__unused_flag_count__ = mine_count
-
-        # Create minesweeper grid.
-        self.__grid__ = np.empty((rows, columns), dtype=Cell)
-        self.__prev_moves__ = []
-        for r in range(rows):
-            for c in range(columns):
-                self.__grid__[r][c] = Cell()
-
-        # Add mines.
-        self.__mine_locations__ = np.array([(k // columns, k - (k // columns) * columns)
-                                            for k in random.sample(range(0, rows*columns), mine_count)])
-        for r, c in self.__mine_locations__:
-            self.__grid__[r][c].mine = True
-        for r in range(rows):
-            for c in range(columns):
-                for r2, c2 in self.get_surrounding_cells(r, c):
-                    if self.__grid__[r2][c2].mine:
-                        self.__grid__[r][c].surrounding_count += 1
+        self.__state_version__ = 0
+        self.__change_feeds__ = []
+
+        # Create minesweeper grid, stored as one array per cell attribute.
+        self.__revealed__ = np.zeros((rows, columns), dtype=bool)
+        self.__flagged__ = np.zeros((rows, columns), dtype=bool)
+
+        # Move log. Every chain reveal, flag and unflag is a move, stored as the run of entries (see REVEAL_ENTRY) from
+        # its start offset up to the next move's. The counter is shared by every fork or snapshot sharing this state.
+        self.__move_log__ = array.array("q")
+        self.__move_starts__ = array.array("q")
+        self.__state_owners__ = [1]
+
+        # Frontier index, kept up to date on every reveal / unreveal / flag / unflag. The border counts hold, for every
+        # cell, the number of surrounding revealed non-mine cells, so the border cells are the unrevealed cells with a
+        # non-zero count. The closed counts hold the number of surrounding cells that are revealed or flagged, so the
+        # frontier cells are the number cells with fewer closed counts than surrounding cells.
+        self.__number_cells__ = set()
+        self.__frontier_cells__ = set()
+        self.__border_cells__ = set()
+        self.__border_counts__ = np.zeros((rows, columns), dtype=np.uint8)
+        self.__closed_counts__ = np.zeros((rows, columns), dtype=np.uint8)
+
+        # Add mines. In first click safe games they are only placed on the first reveal (see __place_mines__).
+        self.__mine_seed__ = seed
+        self.__mines_placed__ = False
+        self.__mines__ = np.zeros((rows, columns), dtype=bool)
+        self.__surrounding_counts__ = np.zeros((rows, columns), dtype=np.uint8)
+        self.__opening_labels__ = None
+        self.__opening_bounds__ = None
+        if not first_click_safe:
+            self.__set_mines__(generate_mine_mask(rows, columns, mine_count, seed))
+
+    @classmethod
+    def from_layout(cls, mine_mask):
+        mine_mask = np.array(mine_mask, dtype=bool)
+        game = cls(mine_mask.shape[0], mine_mask.shape[1], 0, first_click_safe=True)
+        game.__mine_count__ = game.__unused_flag_count__ = int(np.count_nonzero(mine_mask))
+        game.__set_mines__(mine_mask)
+        return game
+
+    @classmethod
+    def from_visible_state(cls, surrounding_counts, revealed_mask, flagged_mask, mine_count):
+        # A game in a position seen by a player, whose mines are unknown. Only what the player can see is set, which is
+        # all the bot looks at, so it can be solved but not played on.
+        revealed_mask = np.array(revealed_mask, dtype=bool)
+        game = cls(revealed_mask.shape[0], revealed_mask.shape[1], 0, first_click_safe=True)
+        game.__mine_count__ = mine_count
+        game.__mines_placed__ = True
+        game.__surrounding_counts__ = np.where(revealed_mask, surrounding_counts, 0).astype(np.uint8)
+        for row, column in game.__cells__(revealed_mask):
+            game.__single_reveal__(row, column)
+        game.__flagged__ = np.array(flagged_mask, dtype=bool) & ~revealed_mask
+        game.__unused_flag_count__ = mine_count - int(np.count_nonzero(game.__flagged__))
+        for row, column in game.__cells__(game.__flagged__):
+            game.__index_closing__(row, column, True)
+        game.__move_log__ = array.array("q")
+        return game
+
+    # Snapshots and forks. Both share the state containers with this game, which is only copied when changed.
+    def snapshot(self):
+        self.__state_owners__[0] += 1
+        return {name: value for name, value in self.__dict__.items() if name != "__change_feeds__"}
+
+    def restore(self, snapshot):
+        if self.__change_feeds__:
+            for row, column in self.__changed_cells__(snapshot):
+                self.__record_change__(row, column)
+
+        self.__state_owners__[0] -= 1
+        state_version = self.__state_version__ + 1
+        self.__dict__.update(snapshot)
+        self.__state_owners__[0] += 1
+        self.__state_version__ = state_version
+
+    def __changed_cells__(self, snapshot):
+        return self.__cells__((self.__revealed__ != snapshot["__revealed__"]) |
+                              (self.__flagged__ != snapshot["__flagged__"]))
+
+    def fork(self):
+        duplicate = object.__new__(type(self))
+        duplicate.__dict__.update(self.snapshot())
+        duplicate.__change_feeds__ = []
+        return duplicate
+
+    def __deepcopy__(self, memo):
+        return self.fork()
+
+    def __own_state__(self):
+        if self.__state_owners__[0] > 1:
+            self.__state_owners__[0] -= 1
+            self.__state_owners__ = [1]
+            for name in COPY_ON_WRITE_STATE:
+                setattr(self, name, copy.copy(getattr(self, name)))
+
+    @staticmethod
+    def __read_only__(array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+    @staticmethod
+    def __cells__(mask):
+        return tuple(zip(*(indices.tolist() for indices in np.nonzero(mask))))
 
     # Getters
     def get_rows(self):
@@ -65,21 +264,48 @@ class Game:
     def get_game_outcome(self):
         return self.__game_outcome__
 
+    def get_state_version(self):
+        return self.__state_version__
+
+    # Change feeds, which every cell whose revealed or flagged state changes is added to. Each consumer removes the
+    # cells from its own feed once it has dealt with them.
+    def watch_changes(self):
+        feed = set()
+        self.__change_feeds__.append(feed)
+        return feed
+
+    def unwatch_changes(self, feed):
+        self.__change_feeds__ = [watched for watched in self.__change_feeds__ if watched is not feed]
+
+    def __record_change__(self, row, column):
+        self.__state_version__ += 1
+        for feed in self.__change_feeds__:
+            feed.add((row, column))
+
+    def __record_changes__(self, mask, top, left):
+        # Records a change to every cell set in a mask of the window with the given top left cell. The cells are only
+        # listed if a feed is watching.
+        self.__state_version__ += int(np.count_nonzero(mask))
+        if self.__change_feeds__:
+            cells = tuple((r + top, c + left) for r, c in self.__cells__(mask))
+            for feed in self.__change_feeds__:
+                feed.update(cells)
+
     def is_revealed(self, row, column):
-        return self.__grid__[row][column].revealed
+        return bool(self.__revealed__[row, column])
 
     def get_surrounding_count(self, row, column):
-        if self.is_revealed(row, column) or self.__game_outcome__ != GameOutcome.INCONCLUSIVE:
-            return self.__grid__[row][column].surrounding_count
+        if self.__revealed__[row, column] or self.__game_outcome__ != GameOutcome.INCONCLUSIVE:
+            return int(self.__surrounding_counts__[row, column])
         else:
             return 0
 
     def is_flagged(self, row, column):
-        return self.__grid__[row][column].flagged
+        return bool(self.__flagged__[row, column])
 
     def is_mine(self, row, column):
-        if self.is_revealed(row, column) or self.__game_outcome__ != GameOutcome.INCONCLUSIVE:
-            return self.__grid__[row][column].mine
+        if self.__revealed__[row, column] or self.__game_outcome__ != GameOutcome.INCONCLUSIVE:
+            return bool(self.__mines__[row, column])
         else:
             return False
 
@@ -87,55 +313,61 @@ class Game:
         return iter([(r2, c2) for r2 in range(row - 1, row + 1 + 1) for c2 in range(column - 1, column + 1 + 1)
                      if 0 <= r2 < self.__rows__ and 0 <= c2 < self.__columns__ and not (r2 == row and c2 == column)])
 
+    # Bulk getters, returning read-only whole-board arrays that follow the same visibility rules as the getters above.
+    def get_revealed_mask(self):
+        return self.__read_only__(self.__revealed__)
+
+    def get_flagged_mask(self):
+        return self.__read_only__(self.__flagged__)
+
+    def get_mine_mask(self):
+        if self.__game_outcome__ != GameOutcome.INCONCLUSIVE:
+            return self.__read_only__(self.__mines__)
+        return self.__read_only__(self.__mines__ & self.__revealed__)
+
+    def get_surrounding_count_grid(self):
+        if self.__game_outcome__ != GameOutcome.INCONCLUSIVE:
+            return self.__read_only__(self.__surrounding_counts__)
+        return self.__read_only__(np.where(self.__revealed__, self.__surrounding_counts__, np.uint8(0)))
+
     def get_revealed_number_cells(self, include_flag_neighbours=True):
-        number_cells = set()
-        for r in range(self.__rows__):
-            for c in range(self.__columns__):
-                if (self.__grid__[r][c].revealed and self.__grid__[r][c].surrounding_count > 0 and
-                        not self.__grid__[r][c].mine):
-                    if include_flag_neighbours:
-                        number_cells.add((r, c))
-                    else:
-                        nonflagged_around = False
-                        for r2, c2 in self.get_surrounding_cells(r, c):
-                            if not self.__grid__[r2][c2].flagged and not self.__grid__[r2][c2].revealed:
-                                nonflagged_around = True
-                                break
-                        if nonflagged_around:
-                            number_cells.add((r, c))
-        return tuple(number_cells)
+        if include_flag_neighbours:
+            return tuple(self.__number_cells__)
+        return tuple(self.__frontier_cells__)
 
     def get_unrevealed_border_cells(self, include_flagged=True):
-        border_cells = set()
-        for n_r in range(self.__rows__):
-            for n_c in range(self.__columns__):
-                if self.__grid__[n_r][n_c].revealed and not self.__grid__[n_r][n_c].mine:
-                    for b_r, b_c in self.get_surrounding_cells(n_r, n_c):
-                        if ((include_flagged or not self.__grid__[b_r][b_c].flagged) and
-                                not self.__grid__[b_r][b_c].revealed):
-                            border_cells.add((b_r, b_c))
-        return tuple(border_cells)
+        if include_flagged:
+            return tuple(self.__border_cells__)
+        return tuple((r, c) for r, c in self.__border_cells__ if not self.__flagged__[r, c])
 
     def get_unrevealed_nonborder_cells(self, include_flagged=True):
-        border_cells = set(self.get_unrevealed_border_cells())
-
-        nonborder_cells = set()
-        for r in range(self.__rows__):
-            for c in range(self.__columns__):
-                if not self.__grid__[r][c].revealed and (include_flagged or not self.__grid__[r][c].flagged):
-                    if (r, c) not in border_cells:
-                        nonborder_cells.add((r, c))
-        return tuple(nonborder_cells)
+        nonborder_mask = ~self.__revealed__ & (self.__border_counts__ == 0)
+        if not include_flagged:
+            nonborder_mask &= ~self.__flagged__
+        return self.__cells__(nonborder_mask)
+
+    def get_unrevealed_nonborder_count(self, include_flagged=True):
+        nonborder_count = (self.__rows__ * self.__columns__ - self.__revealed_cell_count__) - len(self.__border_cells__)
+        if not include_flagged:
+            # Flagged cells are never revealed, so the flagged non-border cells are the flags not on border cells.
+            flagged_count = self.__mine_count__ - self.__unused_flag_count__
+            nonborder_count -= flagged_count - len([1 for r, c in self.__border_cells__ if self.__flagged__[r, c]])
+        return nonborder_count
 
     # Actions / Game Interactions
     def __single_reveal__(self, row, column):
-        if not self.__grid__[row][column].revealed and self.__game_outcome__ == GameOutcome.INCONCLUSIVE:
-            self.__grid__[row][column].revealed = True
+        if not self.__revealed__[row, column] and self.__game_outcome__ == GameOutcome.INCONCLUSIVE:
+            if self.__flagged__[row, column]:
+                self.__single_flag__(row, column, False)
+                self.__log_entry__(row, column, UNFLAG_ENTRY)
+            self.__revealed__[row, column] = True
             self.__revealed_cell_count__ += 1
-            if self.__grid__[row][column].flagged:
-                self.unflag(row, column)
+            self.__record_change__(row, column)
+            self.__log_entry__(row, column, REVEAL_ENTRY)
+            self.__index_reveal__(row, column)
 
-            if self.__grid__[row][column].mine:
+            if self.__mines__[row, column]:
+                self.__revealed_mine_count__ += 1
                 self.__game_outcome__ = GameOutcome.LOSS
             elif self.__revealed_cell_count__ == self.__rows__ * self.__columns__ - self.__mine_count__:
                 self.__game_outcome__ = GameOutcome.WIN
@@ -145,48 +377,284 @@ class Game:
         return False
 
     def __single_unreveal__(self, row, column):
-        if self.__grid__[row][column].revealed:
-            self.__grid__[row][column].revealed = False
+        if self.__revealed__[row, column]:
+            self.__revealed__[row, column] = False
             self.__revealed_cell_count__ -= 1
+            self.__record_change__(row, column)
+            if self.__mines__[row, column]:
+                self.__revealed_mine_count__ -= 1
+            self.__index_unreveal__(row, column)
 
             if self.__game_outcome__ == GameOutcome.WIN:
                 self.__game_outcome__ = GameOutcome.INCONCLUSIVE
-            elif self.__game_outcome__ == GameOutcome.LOSS:
-                lost = False
-                for r, c in self.__mine_locations__:
-                    if self.__grid__[r][c].revealed and self.__grid__[r][c].mine:
-                        lost = True
-                        break
-                if not lost:
-                    self.__game_outcome__ = GameOutcome.INCONCLUSIVE
+            elif self.__game_outcome__ == GameOutcome.LOSS and self.__revealed_mine_count__ == 0:
+                self.__game_outcome__ = GameOutcome.INCONCLUSIVE
             return True
         return False
 
+    def __index_reveal__(self, row, column):
+        self.__border_cells__.discard((row, column))
+        if not self.__mines__[row, column]:
+            if self.__surrounding_counts__[row, column] > 0:
+                self.__number_cells__.add((row, column))
+            for r2, c2 in self.get_surrounding_cells(row, column):
+                self.__border_counts__[r2, c2] += 1
+                if not self.__revealed__[r2, c2]:
+                    self.__border_cells__.add((r2, c2))
+        self.__index_closing__(row, column, True)
+
+    def __index_unreveal__(self, row, column):
+        if not self.__mines__[row, column]:
+            self.__number_cells__.discard((row, column))
+            for r2, c2 in self.get_surrounding_cells(row, column):
+                self.__border_counts__[r2, c2] -= 1
+                if self.__border_counts__[r2, c2] == 0:
+                    self.__border_cells__.discard((r2, c2))
+        if self.__border_counts__[row, column] > 0:
+            self.__border_cells__.add((row, column))
+        self.__index_closing__(row, column, False)
+
+    def __index_closing__(self, row, column, closed):
+        # A cell was revealed or flagged (closed), or unrevealed or unflagged, so it and the number cells around it may
+        # have joined or left the frontier.
+        for r2, c2 in self.get_surrounding_cells(row, column):
+            if closed:
+                self.__closed_counts__[r2, c2] += 1
+            else:
+                self.__closed_counts__[r2, c2] -= 1
+            self.__index_frontier__(r2, c2)
+        self.__index_frontier__(row, column)
+
+    def __index_frontier__(self, row, column):
+        surrounding_total = ((min(row + 2, self.__rows__) - max(row - 1, 0)) *
+                             (min(column + 2, self.__columns__) - max(column - 1, 0)) - 1)
+        if (row, column) in self.__number_cells__ and self.__closed_counts__[row, column] < surrounding_total:
+            self.__frontier_cells__.add((row, column))
+        else:
+            self.__frontier_cells__.discard((row, column))
+
+    def __index_frontier_window__(self, top, left, bottom, right, touched):
+        # The vectorised __index_frontier__, for the touched cells of a window. Only numbered cells can be frontier
+        # cells, so the zero cells and mines are left alone.
+        window = (slice(top, bottom), slice(left, right))
+        touched = touched & (self.__surrounding_counts__[window] > 0) & ~self.__mines__[window]
+        number_cells = self.__revealed__[window] & ~self.__mines__[window] & (self.__surrounding_counts__[window] > 0)
+        frontier = number_cells & (self.__closed_counts__[window] <
+                                   self.__surrounding_totals__(top, left, bottom, right))
+        self.__frontier_cells__.difference_update((r + top, c + left) for r, c in self.__cells__(touched & ~frontier))
+        self.__frontier_cells__.update((r + top, c + left) for r, c in self.__cells__(touched & frontier))
+
+    def __surrounding_totals__(self, top, left, bottom, right):
+        # The number of surrounding cells on the board of every cell of a window.
+        row_spans = np.minimum(np.arange(top, bottom) + 2, self.__rows__) - np.maximum(np.arange(top, bottom) - 1, 0)
+        column_spans = (np.minimum(np.arange(left, right) + 2, self.__columns__) -
+                        np.maximum(np.arange(left, right) - 1, 0))
+        return row_spans[:, np.newaxis] * column_spans - 1
+
+    def __single_flag__(self, row, column, flagged):
+        self.__flagged__[row, column] = flagged
+        self.__unused_flag_count__ += -1 if flagged else 1
+        self.__record_change__(row, column)
+        self.__index_closing__(row, column, flagged)
+
+    def __log_entry__(self, row, column, kind):
+        self.__move_log__.append((row * self.__columns__ + column) << 2 | kind)
+
+    def __log_entries__(self, flat_indices, kind):
+        self.__move_log__.frombytes((flat_indices.astype(np.int64) << 2 | kind).tobytes())
+
+    def __undo_entry__(self, entry):
+        row, column = divmod(entry >> 2, self.__columns__)
+        kind = entry & 3
+        if kind == REVEAL_ENTRY:
+            self.__single_unreveal__(row, column)
+        else:
+            self.__single_flag__(row, column, kind == UNFLAG_ENTRY)
+
+    def __undo_entries__(self, start, end):
+        # A move's entries are its flag changes and / or its reveals. Every reveal is undone at once, then the flag
+        # changes in reverse, which leaves the same state as undoing each entry in reverse.
+        entries = np.frombuffer(self.__move_log__[start:end], dtype=np.int64)
+        kinds = entries & 3
+        is_reveal = (kinds == REVEAL_ENTRY) | (kinds == OPENING_ENTRY)
+        if is_reveal.any():
+            self.__unreveal_cells__(entries[kinds == REVEAL_ENTRY] >> 2, entries[kinds == OPENING_ENTRY] >> 2)
+        for entry in reversed(entries[~is_reveal].tolist()):
+            self.__undo_entry__(entry)
+
+    def __unreveal_cells__(self, flat_indices, openings):
+        # Unreveals a batch of revealed cells and the zero cells of whole openings at once, the reverse of
+        # __reveal_opening__, in a window one cell around them.
+        cell_rows, cell_columns = np.divmod(flat_indices, self.__columns__)
+        boxes = self.__opening_bounds__[openings] if openings.size else np.empty((0, 4), dtype=np.int64)
+        if flat_indices.size:
+            boxes = np.vstack((boxes, [[cell_rows.min(), cell_columns.min(), cell_rows.max() + 1,
+                                        cell_columns.max() + 1]]))
+        top, left = max(int(boxes[:, 0].min()) - 1, 0), max(int(boxes[:, 1].min()) - 1, 0)
+        bottom = min(int(boxes[:, 2].max()) + 1, self.__rows__)
+        right = min(int(boxes[:, 3].max()) + 1, self.__columns__)
+        window = (slice(top, bottom), slice(left, right))
+        unrevealed = np.zeros((bottom - top, right - left), dtype=bool)
+        if openings.size:
+            unrevealed |= np.isin(self.__opening_labels__[window], openings)
+        unrevealed[cell_rows - top, cell_columns - left] = True
+
+        self.__revealed__[window] &= ~unrevealed
+        self.__revealed_cell_count__ -= int(np.count_nonzero(unrevealed))
+        self.__record_changes__(unrevealed, top, left)
+        mines = unrevealed & self.__mines__[window]
+        self.__revealed_mine_count__ -= int(np.count_nonzero(mines))
+
+        # Only the numbered cells unrevealed were number cells, and only the cells around the unrevealed ones that are
+        # still revealed keep them on the border, so the sets are only updated around the edge of the unrevealed cells.
+        closed_counts = count_neighbours(unrevealed)
+        neighbour_counts = count_neighbours(unrevealed & ~mines)
+        self.__border_counts__[window] -= neighbour_counts
+        self.__closed_counts__[window] -= closed_counts
+        numbered = unrevealed & ~mines & (self.__surrounding_counts__[window] > 0)
+        self.__number_cells__.difference_update((r + top, c + left) for r, c in self.__cells__(numbered))
+        border = ~self.__revealed__[window] & (self.__border_counts__[window] > 0)
+        touched = neighbour_counts > 0
+        self.__border_cells__.difference_update((r + top, c + left)
+                                                for r, c in self.__cells__(touched & ~unrevealed & ~border))
+        self.__border_cells__.update((r + top, c + left) for r, c in self.__cells__((touched | unrevealed) & border))
+        self.__index_frontier_window__(top, left, bottom, right, touched | unrevealed | (closed_counts > 0))
+
+        if self.__game_outcome__ == GameOutcome.WIN:
+            self.__game_outcome__ = GameOutcome.INCONCLUSIVE
+        elif self.__game_outcome__ == GameOutcome.LOSS and self.__revealed_mine_count__ == 0:
+            self.__game_outcome__ = GameOutcome.INCONCLUSIVE
+
+    def __undo_move__(self, move):
+        start = self.__move_starts__[move]
+        end = self.__move_starts__[move + 1] if move + 1 < len(self.__move_starts__) else len(self.__move_log__)
+        self.__undo_entries__(start, end)
+        del self.__move_log__[start:end]
+        del self.__move_starts__[move]
+        for later_move in range(move, len(self.__move_starts__)):
+            self.__move_starts__[later_move] -= end - start
+
+    def get_move_count(self):
+        return len(self.__move_starts__)
+
+    def __place_mines__(self, row, column):
+        # Keep the first revealed cell free of mines, along with its surrounding cells if there is room, so that it
+        # opens up a region.
+        safe_mask = np.zeros((self.__rows__, self.__columns__), dtype=bool)
+        safe_mask[row, column] = True
+        if self.__rows__ * self.__columns__ - 9 >= self.__mine_count__:
+            safe_mask[max(row - 1, 0):row + 2, max(column - 1, 0):column + 2] = True
+        if self.__rows__ * self.__columns__ - np.count_nonzero(safe_mask) < self.__mine_count__:
+            safe_mask = None
+        self.__set_mines__(generate_mine_mask(self.__rows__, self.__columns__, self.__mine_count__, self.__mine_seed__,
+                                              safe_mask))
+
+    def __set_mines__(self, mines):
+        # The mines never change once placed, so the openings are found once here. An opening is a zero region of the
+        # board along with the numbered cells around it, all of which a chain reveal of any of its zero cells reveals.
+        self.__mines__ = mines
+        self.__surrounding_counts__ = count_neighbours(mines)
+        self.__opening_labels__, self.__opening_bounds__ = label_regions((self.__surrounding_counts__ == 0) & ~mines)
+        self.__mines_placed__ = True
+
     def chain_reveal(self, row, column):
+        if not self.__mines_placed__:
+            self.__place_mines__(row, column)
+        self.__own_state__()
+        self.__move_starts__.append(len(self.__move_log__))
+        if (self.__opening_labels__ is not None and self.__opening_labels__[row, column] >= 0 and
+                not self.__revealed__[row, column] and self.__game_outcome__ == GameOutcome.INCONCLUSIVE):
+            self.__reveal_opening__(self.__opening_labels__[row, column])
+        else:
+            self.__flood_reveal__(row, column)
+        if self.__move_starts__[-1] == len(self.__move_log__):
+            self.__move_starts__.pop()
+
+    def __flood_reveal__(self, row, column):
+        # Reveals cell by cell, spreading from every zero cell revealed.
         to_reveal_list = [(row, column)]
         to_reveal_set = {(row, column)}
         for r, c in to_reveal_list:
-            self.__single_reveal__(r, c)
+            revealed = self.__single_reveal__(r, c)
             to_reveal_set.remove((r, c))
-            if self.__grid__[r][c].surrounding_count == 0:
+            if revealed and self.__surrounding_counts__[r, c] == 0:
                 for r2, c2 in self.get_surrounding_cells(r, c):
-                    if not self.__grid__[r2][c2].revealed and (r2, c2) not in to_reveal_set:
+                    if not self.__revealed__[r2, c2] and (r2, c2) not in to_reveal_set:
                         to_reveal_list.append((r2, c2))
                         to_reveal_set.add((r2, c2))
-        self.__prev_moves__.append(tuple(to_reveal_list))
+
+    def __reveal_opening__(self, opening):
+        # Reveals a whole opening at once. Its cells are the zero region dilated by one cell, and the border counts
+        # change up to one cell further out, so all the work is done in a window two cells around the region.
+        top, left, bottom, right = self.__opening_bounds__[opening].tolist()
+        top, left = max(top - 2, 0), max(left - 2, 0)
+        bottom, right = min(bottom + 2, self.__rows__), min(right + 2, self.__columns__)
+        window = (slice(top, bottom), slice(left, right))
+
+        region = self.__opening_labels__[window] == opening
+        revealed = self.__revealed__[window]
+        newly_revealed = (region | (count_neighbours(region) > 0)) & ~revealed
+
+        # The zero cells of an opening are only ever revealed together, so they are logged as the opening. The numbered
+        # cells around them, which other openings may share, are the only ones logged and indexed one by one.
+        rim_rows, rim_columns = np.nonzero(newly_revealed & ~region)
+        rim_rows += top
+        rim_columns += left
+        rim_cells = tuple(zip(rim_rows.tolist(), rim_columns.tolist()))
+
+        # No cell of an opening is a mine, and flags on it are removed, as they are by a single reveal. Flagged cells
+        # were already closed.
+        flagged = self.__flagged__[window]
+        closed_counts = count_neighbours(newly_revealed & ~flagged)
+        unflagged = newly_revealed & flagged
+        if unflagged.any():
+            flagged &= ~unflagged
+            self.__unused_flag_count__ += int(np.count_nonzero(unflagged))
+            unflagged_rows, unflagged_columns = np.nonzero(unflagged)
+            self.__log_entries__((unflagged_rows + top) * self.__columns__ + unflagged_columns + left, UNFLAG_ENTRY)
+        was_border = newly_revealed & (self.__border_counts__[window] > 0)
+        revealed |= newly_revealed
+        self.__revealed_cell_count__ += int(np.count_nonzero(newly_revealed))
+        self.__record_changes__(newly_revealed, top, left)
+        self.__log_entries__(rim_rows * self.__columns__ + rim_columns, REVEAL_ENTRY)
+        self.__move_log__.append(int(opening) << 2 | OPENING_ENTRY)
+
+        neighbour_counts = count_neighbours(newly_revealed)
+        self.__border_counts__[window] += neighbour_counts
+        self.__closed_counts__[window] += closed_counts
+        self.__number_cells__.update(rim_cells)
+        self.__border_cells__.difference_update((r + top, c + left) for r, c in self.__cells__(was_border))
+        self.__border_cells__.update((r + top, c + left) for r, c in self.__cells__((neighbour_counts > 0) & ~revealed))
+        self.__index_frontier_window__(top, left, bottom, right, newly_revealed | (closed_counts > 0))
+
+        if self.__revealed_cell_count__ == self.__rows__ * self.__columns__ - self.__mine_count__:
+            self.__game_outcome__ = GameOutcome.WIN
 
     def undo_reveal(self):
-        if self.__prev_moves__:
-            for r, c in self.__prev_moves__.pop():
-                self.__single_unreveal__(r, c)
+        # Undoes the last chain reveal, leaving any flag moves made since in place.
+        self.__own_state__()
+        for move in reversed(range(len(self.__move_starts__))):
+            end = self.__move_starts__[move + 1] if move + 1 < len(self.__move_starts__) else len(self.__move_log__)
+            if self.__move_log__[end - 1] & 3 in (REVEAL_ENTRY, OPENING_ENTRY):
+                self.__undo_move__(move)
+                return
+
+    def undo_move(self):
+        self.__own_state__()
+        if self.__move_starts__:
+            self.__undo_move__(len(self.__move_starts__) - 1)
 
     def flag(self, row, column):
-        if (self.__unused_flag_count__ > 0 and not self.__grid__[row][column].revealed and
-                not self.__grid__[row][column].flagged):
-            self.__grid__[row][column].flagged = True
-            self.__unused_flag_count__ -= 1
+        if (self.__unused_flag_count__ > 0 and not self.__revealed__[row, column] and
+                not self.__flagged__[row, column]):
+            self.__own_state__()
+            self.__single_flag__(row, column, True)
+            self.__move_starts__.append(len(self.__move_log__))
+            self.__log_entry__(row, column, FLAG_ENTRY)
 
     def unflag(self, row, column):
-        if self.__grid__[row][column].flagged:
-            self.__grid__[row][column].flagged = False
-            self.__unused_flag_count__ += 1
+        if self.__flagged__[row, column]:
+            self.__own_state__()
+            self.__single_flag__(row, column, False)
+            self.__move_starts__.append(len(self.__move_log__))
+            self.__log_entry__(row, column, UNFLAG_ENTRY)
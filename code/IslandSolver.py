@@ -0,0 +1,1084 @@
+import collections
+import concurrent.futures
+import itertools
+import math
+import random
+import statistics
+import time
+
+import numpy as np
+
+
+NOT_MINE = 0
+MINE = 1
+
+# Islands smaller than this are solved in the calling process even when an executor is available.
+INLINE_ISLAND_SIZE = 16
+
+# Number of random probes, and of batches they are split into, when an island's arrangements are estimated.
+SAMPLE_COUNT = 4000
+BATCH_COUNT = 20
+
+# If every probe of an estimate hits a dead end, it is retried this many times with this many times more probes, while
+# the deadline allows. Islands that still have no estimate fall back on estimate_island_densities.
+ESTIMATE_RETRIES = 2
+ESTIMATE_RETRY_FACTOR = 4
+
+# The constant factor that the counts of estimate_island_densities are scaled by, which keeps them integers.
+DENSITY_SCALE = 1 << 20
+
+# Number of search nodes visited between checks of the deadline.
+DEADLINE_CHECK_INTERVAL = 1024
+
+# Islands with at least this many cells, whose cells can be swept with at most this many constraints active at once,
+# are counted by count_island_solutions_frontier rather than searched. Smaller islands are searched faster.
+FRONTIER_MIN_ISLAND_SIZE = 32
+FRONTIER_MAX_WIDTH = 16
+
+
+class SearchBudgetExceeded(Exception):
+    """
+    Raised when an exact island search runs past its node budget or deadline.
+    """
+
+
+class SolverStats:
+    """
+    Instrumentation of the probability engine, collected by a Bot when its stats field is set. The counters of several
+    calls (or games) can be summed with add.
+
+    :ivar calls: The number of probability tables constructed.
+    :type calls: int
+    :ivar step_times: The time, in seconds, spent in each of the five steps of Bot.construct_probability_tables.
+    :type step_times: List[float]
+    :ivar island_sizes: A histogram from island size to the number of islands of that size.
+    :type island_sizes: collections.Counter
+    :ivar cached_islands: The number of islands found in the island cache.
+    :type cached_islands: int
+    :ivar estimated_islands: The number of islands estimated by sampling, rather than searched exactly.
+    :type estimated_islands: int
+    :ivar nodes_visited: The number of search nodes visited by exact island searches.
+    :type nodes_visited: int
+    :ivar nodes_pruned: The number of branches of exact island searches cut off by a violated constraint.
+    :type nodes_pruned: int
+    :ivar frontier_islands: The number of islands counted by sweeping their frontier, rather than searched.
+    :type frontier_islands: int
+    :ivar frontier_states: The number of sweep states expanded by the frontier counts.
+    :type frontier_states: int
+    :ivar frontier_time: The time, in seconds, spent on frontier counts in the calling process, which is part of the
+                         search step's time. Frontier counts handed to an executor are not timed.
+    :type frontier_time: float
+    :ivar solution_magnitudes: A histogram from the number of decimal digits of an island's exact arrangement count to
+                               the number of islands with such a count.
+    :type solution_magnitudes: collections.Counter
+    :ivar largest_solution_count: The largest exact arrangement count of a single island.
+    :type largest_solution_count: int
+    :ivar combinations: The number of products of mine amount counts taken when combining islands.
+    :type combinations: int
+    :ivar guesses: The number of reveals chosen without certainty, from a probability table or at random.
+    :type guesses: int
+    :ivar guess_success_chance: The sum, over guesses made from a probability table, of their chance of being safe.
+    :type guess_success_chance: float
+    :ivar random_guesses: The number of guesses made at random, without a probability table.
+    :type random_guesses: int
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.step_times = [0.0] * 5
+        self.island_sizes = collections.Counter()
+        self.cached_islands = 0
+        self.estimated_islands = 0
+        self.nodes_visited = 0
+        self.nodes_pruned = 0
+        self.frontier_islands = 0
+        self.frontier_states = 0
+        self.frontier_time = 0.0
+        self.solution_magnitudes = collections.Counter()
+        self.largest_solution_count = 0
+        self.combinations = 0
+        self.guesses = 0
+        self.guess_success_chance = 0.0
+        self.random_guesses = 0
+
+    def add(self, other):
+        """
+        Adds the counters of another SolverStats to this one.
+        """
+
+        self.calls += other.calls
+        self.step_times = [time1 + time2 for time1, time2 in zip(self.step_times, other.step_times)]
+        self.island_sizes.update(other.island_sizes)
+        self.cached_islands += other.cached_islands
+        self.estimated_islands += other.estimated_islands
+        self.nodes_visited += other.nodes_visited
+        self.nodes_pruned += other.nodes_pruned
+        self.frontier_islands += other.frontier_islands
+        self.frontier_states += other.frontier_states
+        self.frontier_time += other.frontier_time
+        self.solution_magnitudes.update(other.solution_magnitudes)
+        self.largest_solution_count = max(self.largest_solution_count, other.largest_solution_count)
+        self.combinations += other.combinations
+        self.guesses += other.guesses
+        self.guess_success_chance += other.guess_success_chance
+        self.random_guesses += other.random_guesses
+
+    def to_dict(self):
+        table_guesses = self.guesses - self.random_guesses
+        return {"calls": self.calls,
+                "step_times": self.step_times,
+                "island_sizes": {str(size): count for size, count in sorted(self.island_sizes.items())},
+                "cached_islands": self.cached_islands,
+                "estimated_islands": self.estimated_islands,
+                "nodes_visited": self.nodes_visited,
+                "nodes_pruned": self.nodes_pruned,
+                "frontier_islands": self.frontier_islands,
+                "frontier_states": self.frontier_states,
+                "frontier_time": self.frontier_time,
+                "solution_magnitudes": {str(digits): count
+                                        for digits, count in sorted(self.solution_magnitudes.items())},
+                "largest_solution_count": self.largest_solution_count,
+                "combinations": self.combinations,
+                "guesses": self.guesses,
+                "random_guesses": self.random_guesses,
+                "mean_guess_success_chance": self.guess_success_chance / table_guesses if table_guesses else None}
+
+
+class IslandSolution:
+    """
+    This class summarises every mine arrangement of an island of border cells that is consistent with the surrounding
+    number cells, grouped by how many mines the arrangement uses. Individual arrangements are never stored.
+
+    :ivar island: The border cells of the island, in the order they were searched.
+    :type island: Tuple[Tuple[int, int]]
+    :ivar solution_counts: solution_counts[m] is the number of consistent arrangements that use exactly m mines.
+    :type solution_counts: List[int]
+    :ivar cell_mine_counts: cell_mine_counts[m][j] is the number of consistent arrangements that use exactly m mines
+                            and have a mine on the cell at index j of the island.
+    :type cell_mine_counts: List[List[int]]
+    :ivar batches: None if the counts are exact. Otherwise the counts are estimates (scaled by an arbitrary constant
+                   factor, which does not affect probabilities), and this holds the independent batch estimates they
+                   are the sum of.
+    :type batches: List[IslandSolution]
+    :ivar nodes_visited: The number of search nodes (or sweep states, see count_island_solutions_frontier) visited to
+                         find the counts, or 0 if they were not searched for.
+    :type nodes_visited: int
+    """
+
+    def __init__(self, island, solution_counts=None, cell_mine_counts=None, batches=None):
+        self.island = tuple(island)
+        if solution_counts is None:
+            solution_counts = [0] * (len(island) + 1)
+        if cell_mine_counts is None:
+            cell_mine_counts = [[0] * len(island) for _ in range(len(island) + 1)]
+        self.solution_counts = solution_counts
+        self.cell_mine_counts = cell_mine_counts
+        self.batches = batches
+        self.nodes_visited = 0
+
+    def is_approximate(self):
+        return self.batches is not None
+
+    def relabelled(self, island):
+        """
+        :param island: The new cells of the island, corresponding index by index to the current ones.
+        :return: An IslandSolution sharing this one's counts, but for the given cells.
+        """
+
+        batches = None
+        if self.batches is not None:
+            batches = [batch.relabelled(island) for batch in self.batches]
+        return IslandSolution(island, self.solution_counts, self.cell_mine_counts, batches)
+
+    def sorted(self):
+        """
+        :return: An equivalent IslandSolution whose cells are in sorted order.
+        """
+
+        order = sorted(range(len(self.island)), key=self.island.__getitem__)
+        batches = None
+        if self.batches is not None:
+            batches = [batch.sorted() for batch in self.batches]
+        return IslandSolution([self.island[j] for j in order], self.solution_counts,
+                              [[counts[j] for j in order] for counts in self.cell_mine_counts], batches)
+
+    def get_mine_amounts(self):
+        """
+        :return: A tuple of every mine amount that at least one consistent arrangement uses.
+        """
+
+        return tuple(m for m, count in enumerate(self.solution_counts) if count > 0)
+
+    def get_total_count(self):
+        """
+        :return: The total number of consistent arrangements.
+        """
+
+        return sum(self.solution_counts)
+
+
+def find_certain_cells(number_cells_border_neighbors, surrounding_mine_constraints):
+    """
+    Finds border cells that are certainly safe or certainly mines, in polynomial time. Each number cell gives a linear
+    constraint: the sum of its unknown neighbours equals its remaining mine count. Constraints are repeatedly
+    simplified using the cells decided so far, and compared in overlapping pairs. If one constraint's cells are a
+    subset of another's, their difference is a new constraint. If the mines one constraint needs outside the overlap
+    fill every cell it has outside the overlap, those cells are mines and the other constraint's cells outside the
+    overlap are safe.
+
+    :param number_cells_border_neighbors: A dictionary mapping each number cell to a list of the unknown border cells
+    around it.
+    :param surrounding_mine_constraints: A dictionary mapping each number cell to the number of surrounding mines not
+    yet accounted for by flags.
+    :return: A 2-tuple of the set of certainly safe cells and the set of certain mines.
+    """
+
+    constraints = {}
+    for n_cell, b_cells in number_cells_border_neighbors.items():
+        if b_cells:
+            constraints[frozenset(b_cells)] = surrounding_mine_constraints[n_cell]
+    safe_cells = set()
+    mine_cells = set()
+
+    changed = True
+    while changed:
+        changed = False
+
+        # Substitute the decided cells, and decide the cells of constraints that are all mines or all safe.
+        simplified = {}
+        for b_cells, mines in constraints.items():
+            mines -= len(b_cells & mine_cells)
+            b_cells = b_cells - safe_cells - mine_cells
+            if mines == 0:
+                safe_cells.update(b_cells)
+            elif mines == len(b_cells):
+                mine_cells.update(b_cells)
+            else:
+                simplified[b_cells] = mines
+                continue
+            changed = changed or bool(b_cells)
+        constraints = simplified
+        if changed:
+            continue
+
+        # Compare every pair of overlapping constraints.
+        cell_constraints = {}
+        for b_cells in constraints:
+            for b_cell in b_cells:
+                cell_constraints.setdefault(b_cell, []).append(b_cells)
+        derived = {}
+        for b_cells1, mines1 in constraints.items():
+            overlapping = {b_cells2 for b_cell in b_cells1 for b_cells2 in cell_constraints[b_cell]}
+            for b_cells2 in overlapping:
+                if b_cells2 is b_cells1:
+                    continue
+                mines2 = constraints[b_cells2]
+                only1 = b_cells1 - b_cells2
+                only2 = b_cells2 - b_cells1
+                if not only1:
+                    if only2 not in constraints and only2 not in derived:
+                        derived[only2] = mines2 - mines1
+                elif mines1 - mines2 == len(only1):
+                    mine_cells.update(only1)
+                    safe_cells.update(only2)
+                    changed = True
+        if derived:
+            constraints.update(derived)
+            changed = True
+
+    return safe_cells, mine_cells
+
+
+def order_island_cells(cell_constraints):
+    """
+    Chooses the order in which an island's cells are searched, so that constraints are completed, and dead ends
+    pruned, as early as possible. It starts from the most constrained cell, then repeatedly picks the cell touching the
+    most constraints that the order has already started, preferring cells that complete a constraint.
+
+    :param cell_constraints: A sequence holding, for each cell, the indices of the constraints it belongs to.
+    :return: A list of cell indices in search order.
+    """
+
+    constraint_sizes = {}
+    for constraints in cell_constraints:
+        for k in constraints:
+            constraint_sizes[k] = constraint_sizes.get(k, 0) + 1
+    started = set()
+    remaining = set(range(len(cell_constraints)))
+    order = []
+    while remaining:
+        j = max(remaining, key=lambda j: (len([k for k in cell_constraints[j] if k in started]),
+                                          len([k for k in cell_constraints[j] if constraint_sizes[k] == 1]),
+                                          len(cell_constraints[j]), -j))
+        remaining.remove(j)
+        order.append(j)
+        for k in cell_constraints[j]:
+            started.add(k)
+            constraint_sizes[k] -= 1
+    return order
+
+
+def index_island_constraints(border_cell_island, border_cells_number_neighbors, surrounding_mine_constraints,
+                             surrounding_unknown_constraints):
+    """
+    Indexes the number cells of an island with integers, and copies their constraints into flat lists, for the island
+    searches to work on.
+
+    :return: A 4-tuple of the island as a tuple of cells, the mines each number cell still needs, the unknown cells
+    each number cell has left, and, for each cell of the island, a tuple of the indices of its number cells.
+    """
+
+    island = tuple(border_cell_island)
+    number_cells = sorted({n_cell for b_cell in island for n_cell in border_cells_number_neighbors[b_cell]})
+    constraint_indices = {n_cell: k for k, n_cell in enumerate(number_cells)}
+    mines_needed = [surrounding_mine_constraints[n_cell] for n_cell in number_cells]
+    unknowns_left = [surrounding_unknown_constraints[n_cell] for n_cell in number_cells]
+    cell_constraints = [tuple(constraint_indices[n_cell] for n_cell in border_cells_number_neighbors[b_cell])
+                        for b_cell in island]
+    return island, mines_needed, unknowns_left, cell_constraints
+
+
+def count_island_solutions(border_cell_island, border_cells_number_neighbors, surrounding_mine_constraints,
+                           surrounding_unknown_constraints, max_mines, node_budget=None, deadline=None):
+    """
+    Counts every mine arrangement of an island of border cells that satisfies the surrounding number cells, by mine
+    amount and by cell, using a backtracking search. Memory use is bounded by the island size times the number of mine
+    amounts, regardless of how many arrangements exist.
+
+    The search runs over integer indexed cells and constraints. Each constraint's remaining mines and unknown cells are
+    kept in flat lists, each cell's constraint indices are precomputed, arrangements are held as a bitmask of mines,
+    and the cells are searched in the order chosen by order_island_cells.
+
+    :param border_cell_island: An iterable of integer 2-tuples corresponding to a group of border cells in a
+    minesweeper game.
+    :param border_cells_number_neighbors: A dictionary mapping each border cell to a list of the number cells around it.
+    :param surrounding_mine_constraints: A dictionary with keys of integer 2-tuples corresponding to non-zero revealed
+    cells in a minesweeper game. The values represent the number of surrounding mines not yet accounted for by flags.
+    :param surrounding_unknown_constraints: A dictionary with keys of integer 2-tuples corresponding to non-zero
+    revealed cells in a minesweeper game. The values represent the number of surrounding cells whose mine/not mine
+    status is not yet known.
+    :param max_mines: The largest number of mines an arrangement may use.
+    :param node_budget: The largest number of search nodes to visit, or None for no limit.
+    :param deadline: A time.monotonic() value to stop searching at, or None for no limit.
+    :return: An IslandSolution holding the counts.
+    :raises SearchBudgetExceeded: If the node budget or deadline is exceeded before the search finishes.
+    """
+
+    island, mines_needed, unknowns_left, cell_constraints = index_island_constraints(
+        border_cell_island, border_cells_number_neighbors, surrounding_mine_constraints,
+        surrounding_unknown_constraints)
+    island_solution = IslandSolution(island)
+    solution_counts = island_solution.solution_counts
+    cell_mine_counts = island_solution.cell_mine_counts
+
+    order = order_island_cells(cell_constraints)
+    depth_constraints = [cell_constraints[j] for j in order]
+    depth_bits = [1 << j for j in order]
+    island_size = len(island)
+    nodes_visited = 0
+
+    def search(depth, mines_used, mine_mask):
+        nonlocal nodes_visited
+        nodes_visited += 1
+        if node_budget is not None and nodes_visited > node_budget:
+            raise SearchBudgetExceeded()
+        if deadline is not None and nodes_visited % DEADLINE_CHECK_INTERVAL == 0 and time.monotonic() > deadline:
+            raise SearchBudgetExceeded()
+
+        if depth == island_size:
+            solution_counts[mines_used] += 1
+            counts = cell_mine_counts[mines_used]
+            while mine_mask:
+                lowest_bit = mine_mask & -mine_mask
+                counts[lowest_bit.bit_length() - 1] += 1
+                mine_mask ^= lowest_bit
+            return
+
+        constraints = depth_constraints[depth]
+
+        # Try a mine, which every constraint of the cell must still need and have room for.
+        if mines_used < max_mines:
+            for k in constraints:
+                if not 0 < mines_needed[k] <= unknowns_left[k]:
+                    break
+            else:
+                for k in constraints:
+                    mines_needed[k] -= 1
+                    unknowns_left[k] -= 1
+                search(depth + 1, mines_used + 1, mine_mask | depth_bits[depth])
+                for k in constraints:
+                    mines_needed[k] += 1
+                    unknowns_left[k] += 1
+
+        # Try no mine, which needs every constraint of the cell to have enough other unknown cells left.
+        for k in constraints:
+            if not 0 <= mines_needed[k] < unknowns_left[k]:
+                break
+        else:
+            for k in constraints:
+                unknowns_left[k] -= 1
+            search(depth + 1, mines_used, mine_mask)
+            for k in constraints:
+                unknowns_left[k] += 1
+
+    search(0, 0, 0)
+    island_solution.nodes_visited = nodes_visited
+    return island_solution
+
+
+def order_frontier_cells(cell_constraints):
+    """
+    Chooses the order in which count_island_solutions_frontier sweeps an island's cells, so that few constraints are
+    active (started but not yet completed) at any time. It starts from a cell at one end of the island, found by
+    walking to the farthest cell twice, then repeatedly picks, among the cells of the active constraints, the one that
+    starts the fewest constraints less those it completes, preferring cells nearer the starting end.
+
+    :param cell_constraints: A sequence holding, for each cell, the indices of the constraints it belongs to.
+    :return: A list of cell indices in sweep order.
+    """
+
+    constraint_cells = collections.defaultdict(list)
+    for j, constraints in enumerate(cell_constraints):
+        for k in constraints:
+            constraint_cells[k].append(j)
+
+    def distances_from(start):
+        distances = {start: 0}
+        queue = collections.deque([start])
+        while queue:
+            j = queue.popleft()
+            for k in cell_constraints[j]:
+                for neighbor in constraint_cells[k]:
+                    if neighbor not in distances:
+                        distances[neighbor] = distances[j] + 1
+                        queue.append(neighbor)
+        return distances
+
+    remaining = {k: len(cells) for k, cells in constraint_cells.items()}
+    started = set()
+    ordered = set()
+    candidates = set()
+    order = []
+    while len(order) < len(cell_constraints):
+        if not candidates:
+            # Start a new sweep from one end of the cells not yet ordered (only the first, for a connected island).
+            start = min(j for j in range(len(cell_constraints)) if j not in ordered)
+            distances = distances_from(start)
+            start = max(distances, key=lambda j: (distances[j], -j))
+            distances = distances_from(start)
+            candidates.add(start)
+        j = min(candidates, key=lambda j: (len([k for k in cell_constraints[j] if k not in started]) -
+                                           len([k for k in cell_constraints[j] if remaining[k] == 1]),
+                                           distances[j], j))
+        candidates.remove(j)
+        ordered.add(j)
+        order.append(j)
+        for k in cell_constraints[j]:
+            remaining[k] -= 1
+            if k not in started:
+                started.add(k)
+                candidates.update(neighbor for neighbor in constraint_cells[k] if neighbor not in ordered)
+    return order
+
+
+def frontier_width(cell_constraints, order):
+    """
+    :param cell_constraints: A sequence holding, for each cell, the indices of the constraints it belongs to.
+    :param order: The order in which the cells are swept.
+    :return: The largest number of constraints that are active (started but not yet completed) while a cell is swept.
+    """
+
+    remaining = collections.Counter(k for constraints in cell_constraints for k in constraints)
+    active = set()
+    width = 0
+    for j in order:
+        active.update(cell_constraints[j])
+        width = max(width, len(active))
+        for k in cell_constraints[j]:
+            remaining[k] -= 1
+            if remaining[k] == 0:
+                active.remove(k)
+    return width
+
+
+def count_island_solutions_frontier(border_cell_island, border_cells_number_neighbors, surrounding_mine_constraints,
+                                    surrounding_unknown_constraints, max_mines, node_budget=None, deadline=None):
+    """
+    Counts an island's arrangements exactly like count_island_solutions, and takes the same arguments, but with
+    dynamic programming over a sweep of the cells in the order chosen by order_frontier_cells. The state after each
+    cell is the number of mines each active constraint still needs, and arrangements that reach the same state are
+    counted together, so the work grows linearly with the island size for a bounded number of active constraints
+    (see frontier_width), instead of with the number of arrangements.
+
+    The sweep first enumerates the states and their transitions, and drops the states from which no arrangement can be
+    completed. The counts by mine amount are then propagated forwards and backwards over the states, and the counts of
+    each cell's mine arrangements are the products of the counts on either side of its mine transitions. Each vector of
+    counts by mine amount is packed into one integer, with a field wide enough for the total number of arrangements
+    per mine amount, so that adding vectors is an integer addition, adding a mine is a shift, and the products are
+    single integer multiplications.
+
+    :return: An IslandSolution holding the counts. Its nodes_visited is the number of sweep states expanded.
+    :raises SearchBudgetExceeded: If the node budget or deadline is exceeded by the number of sweep states expanded.
+    """
+
+    island, mines_needed, unknowns_left, cell_constraints = index_island_constraints(
+        border_cell_island, border_cells_number_neighbors, surrounding_mine_constraints,
+        surrounding_unknown_constraints)
+    island_solution = IslandSolution(island)
+    order = order_frontier_cells(cell_constraints)
+    island_size = len(island)
+
+    # Plan each step of the sweep: the mines needed by the constraints the cell starts, which are appended to the
+    # state, the positions and unknown cells left of the cell's constraints, and the positions kept in the next state.
+    remaining = collections.Counter(k for constraints in cell_constraints for k in constraints)
+    unknowns_left = list(unknowns_left)
+    active = []
+    steps = []
+    for j in order:
+        constraints = cell_constraints[j]
+        working = active + [k for k in constraints if k not in active]
+        positions = {k: p for p, k in enumerate(working)}
+        cell_slots = tuple((positions[k], unknowns_left[k]) for k in constraints)
+        for k in constraints:
+            unknowns_left[k] -= 1
+            remaining[k] -= 1
+        kept = [p for p, k in enumerate(working) if remaining[k] > 0]
+        steps.append((tuple(mines_needed[k] for k in working[len(active):]), cell_slots, kept))
+        active = [working[p] for p in kept]
+
+    # Enumerate the states before each step, and the indices of the states a mine or no mine on its cell leads to,
+    # with the same checks as count_island_solutions.
+    nodes_visited = 0
+    layer = [()]
+    transitions = []
+    for started, cell_slots, kept in steps:
+        next_states = {}
+        layer_transitions = []
+        for state in layer:
+            nodes_visited += 1
+            if node_budget is not None and nodes_visited > node_budget:
+                raise SearchBudgetExceeded()
+            if deadline is not None and nodes_visited % DEADLINE_CHECK_INTERVAL == 0 and time.monotonic() > deadline:
+                raise SearchBudgetExceeded()
+
+            working = state + started
+            mine_next = safe_next = -1
+            if all(0 < working[p] <= unknowns for p, unknowns in cell_slots):
+                mined = list(working)
+                for p, _ in cell_slots:
+                    mined[p] -= 1
+                mine_next = next_states.setdefault(tuple(mined[p] for p in kept), len(next_states))
+            if all(0 <= working[p] < unknowns for p, unknowns in cell_slots):
+                safe_next = next_states.setdefault(tuple(working[p] for p in kept), len(next_states))
+            layer_transitions.append((mine_next, safe_next))
+        transitions.append(layer_transitions)
+        layer = list(next_states)
+    island_solution.nodes_visited = nodes_visited
+
+    # Count the completions of each state regardless of mine amount, which bounds every count below.
+    completions = [[1] * len(layer)]
+    for layer_transitions in reversed(transitions):
+        next_completions = completions[-1]
+        completions.append([(next_completions[mine_next] if mine_next >= 0 else 0) +
+                            (next_completions[safe_next] if safe_next >= 0 else 0)
+                            for mine_next, safe_next in layer_transitions])
+    completions.reverse()
+    total_count = completions[0][0]
+    if total_count == 0 or max_mines < 0:
+        return island_solution
+
+    field_bits = total_count.bit_length()
+    amounts = min(max_mines, island_size) + 1
+    amounts_mask = (1 << (amounts * field_bits)) - 1
+
+    # Propagate the counts by mine amount of the arrangements leading to each state, skipping dead states.
+    forward = [[1]]
+    for i, layer_transitions in enumerate(transitions):
+        next_completions = completions[i + 1]
+        next_counts = [0] * len(next_completions)
+        for counts, (mine_next, safe_next) in zip(forward[-1], layer_transitions):
+            if counts:
+                if mine_next >= 0 and next_completions[mine_next]:
+                    next_counts[mine_next] += (counts << field_bits) & amounts_mask
+                if safe_next >= 0 and next_completions[safe_next]:
+                    next_counts[safe_next] += counts
+        forward.append(next_counts)
+
+    # Propagate the counts by mine amount of the arrangements completing each state backwards, and meanwhile multiply
+    # the counts on either side of each mine transition.
+    cell_counts = [0] * island_size
+    backward = [1] * len(completions[-1])
+    for i in reversed(range(island_size)):
+        counts = []
+        mine_counts = 0
+        for prefix_counts, (mine_next, safe_next) in zip(forward[i], transitions[i]):
+            suffix_counts = backward[safe_next] if safe_next >= 0 else 0
+            if mine_next >= 0 and backward[mine_next]:
+                mined_counts = (backward[mine_next] << field_bits) & amounts_mask
+                suffix_counts += mined_counts
+                mine_counts += prefix_counts * mined_counts
+            counts.append(suffix_counts)
+        cell_counts[order[i]] = mine_counts & amounts_mask
+        backward = counts
+
+    field_mask = (1 << field_bits) - 1
+    for m in range(amounts):
+        shift = m * field_bits
+        island_solution.solution_counts[m] = (backward[0] >> shift) & field_mask
+        island_solution.cell_mine_counts[m] = [(counts >> shift) & field_mask for counts in cell_counts]
+    return island_solution
+
+
+def estimate_island_solutions(border_cell_island, border_cells_number_neighbors, surrounding_mine_constraints,
+                              surrounding_unknown_constraints, max_mines, sample_count=SAMPLE_COUNT,
+                              batch_count=BATCH_COUNT, deadline=None):
+    """
+    Estimates the counts that count_island_solutions would give, for islands too large to search exhaustively. Each
+    random probe walks down the search tree, choosing uniformly between the statuses that keep every constraint
+    satisfiable, and weighs the arrangement it reaches by the product of the number of choices at each step (Knuth's
+    estimator). The weighted sum of the probes is an unbiased estimate of the counts, up to a constant factor.
+
+    :param sample_count: The number of random probes.
+    :param batch_count: The number of batches the probes are split into, which give the spread of the estimate.
+    :param deadline: A time.monotonic() value after which no more probes are made, or None for no limit. Estimates are
+                     made once a search has run out of time, so every batch still gets one probe.
+    :return: An approximate IslandSolution (see IslandSolution.batches).
+    """
+
+    island = tuple(border_cell_island)
+    number_cells = {n_cell for b_cell in island for n_cell in border_cells_number_neighbors[b_cell]}
+    batches = [IslandSolution(island) for _ in range(batch_count)]
+
+    for probe in range(sample_count):
+        if deadline is not None and probe >= batch_count and time.monotonic() > deadline:
+            break
+        mine_constraints = {n_cell: surrounding_mine_constraints[n_cell] for n_cell in number_cells}
+        unknown_constraints = {n_cell: surrounding_unknown_constraints[n_cell] for n_cell in number_cells}
+        current_solution = []
+        mines_used = 0
+        weight = 1
+        for b_cell in island:
+            feasible_statuses = [b_cell_status for b_cell_status in (MINE, NOT_MINE)
+                                 if mines_used + b_cell_status <= max_mines and
+                                 all(0 <= mine_constraints[n_cell] - b_cell_status <= unknown_constraints[n_cell] - 1
+                                     for n_cell in border_cells_number_neighbors[b_cell])]
+            if not feasible_statuses:
+                weight = 0
+                break
+
+            b_cell_status = random.choice(feasible_statuses)
+            weight *= len(feasible_statuses)
+            current_solution.append(b_cell_status)
+            mines_used += b_cell_status
+            for n_cell in border_cells_number_neighbors[b_cell]:
+                unknown_constraints[n_cell] -= 1
+                mine_constraints[n_cell] -= b_cell_status
+
+        if weight:
+            batch = batches[probe % batch_count]
+            batch.solution_counts[mines_used] += weight
+            for j, b_cell_status in enumerate(current_solution):
+                if b_cell_status == MINE:
+                    batch.cell_mine_counts[mines_used][j] += weight
+
+    island_solution = IslandSolution(island, batches=batches)
+    for batch in batches:
+        for m, count in enumerate(batch.solution_counts):
+            island_solution.solution_counts[m] += count
+            for j, cell_count in enumerate(batch.cell_mine_counts[m]):
+                island_solution.cell_mine_counts[m][j] += cell_count
+    return island_solution
+
+
+def estimate_island_densities(border_cell_island, border_cells_number_neighbors, surrounding_mine_constraints,
+                              surrounding_unknown_constraints, max_mines):
+    """
+    Makes a rough estimate of an island's counts from the density of mines around each of its cells alone, for islands
+    that neither a search within the budget nor the probes of estimate_island_solutions could count. Each cell is given
+    the mean of the remaining mines per unknown cell of the number cells around it, and the island the mine amount
+    nearest the sum of those densities.
+
+    :return: An approximate IslandSolution (see IslandSolution.batches) with no batches, so its spread is unknown.
+    """
+
+    island = tuple(border_cell_island)
+    densities = []
+    for b_cell in island:
+        density = statistics.fmean(surrounding_mine_constraints[n_cell] / surrounding_unknown_constraints[n_cell]
+                                   for n_cell in border_cells_number_neighbors[b_cell])
+        densities.append(min(max(density, 0.0), 1.0))
+    island_solution = IslandSolution(island, batches=[])
+    mine_amount = max(0, min(round(sum(densities)), max_mines, len(island)))
+    island_solution.solution_counts[mine_amount] = DENSITY_SCALE
+    island_solution.cell_mine_counts[mine_amount] = [round(density * DENSITY_SCALE) for density in densities]
+    return island_solution
+
+
+class IslandCache:
+    """
+    A size-bounded least recently used cache of IslandSolution objects, keyed by the canonical signature of an
+    island's constraint system (see island_signature).
+
+    :ivar maxsize: The largest number of islands the cache holds before evicting the least recently used one.
+    :type maxsize: int
+    :ivar hits: The number of lookups that found a cached island.
+    :type hits: int
+    :ivar misses: The number of lookups that did not.
+    :type misses: int
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__entries__ = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries__)
+
+    def get(self, key):
+        island_solution = self.__entries__.get(key)
+        if island_solution is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.__entries__.move_to_end(key)
+        return island_solution
+
+    def put(self, key, island_solution):
+        self.__entries__[key] = island_solution
+        self.__entries__.move_to_end(key)
+        while len(self.__entries__) > self.maxsize:
+            self.__entries__.popitem(last=False)
+
+    def clear(self):
+        self.__entries__.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def island_signature(border_cell_island, border_cells_number_neighbors, surrounding_mine_constraints, max_mines):
+    """
+    Computes a canonical, translation invariant form of an island's constraint system. The adjacency between the
+    island's cells and its number cells is fully determined by their relative positions, so the signature is made of
+    the island cells and the number cells (with their remaining mine counts) relative to the island's top left corner,
+    together with the largest number of mines the island may use.
+
+    :return: A 2-tuple of the hashable signature and the (row, column) offset that was subtracted from every cell.
+    """
+
+    number_cells = {n_cell for b_cell in border_cell_island for n_cell in border_cells_number_neighbors[b_cell]}
+    offset_r = min(r for r, _ in itertools.chain(border_cell_island, number_cells))
+    offset_c = min(c for _, c in itertools.chain(border_cell_island, number_cells))
+    signature = (tuple(sorted((r - offset_r, c - offset_c) for r, c in border_cell_island)),
+                 tuple(sorted((r - offset_r, c - offset_c, surrounding_mine_constraints[(r, c)])
+                              for r, c in number_cells)),
+                 min(max_mines, len(border_cell_island)))
+    return signature, (offset_r, offset_c)
+
+
+def create_island_executor(max_workers=None):
+    """
+    Creates a persistent pool of worker processes that bots can hand large islands to. The caller owns the pool and is
+    responsible for shutting it down.
+
+    :param max_workers: The number of worker processes. Defaults to the number of CPUs.
+    :return: A concurrent.futures.ProcessPoolExecutor.
+    """
+
+    return concurrent.futures.ProcessPoolExecutor(max_workers)
+
+
+def solve_islands(border_cell_islands, border_cells_number_neighbors, surrounding_mine_constraints,
+                  surrounding_unknown_constraints, max_mines, island_cache=None, executor=None,
+                  inline_island_size=INLINE_ISLAND_SIZE, node_budget=None, deadline=None, sample_count=SAMPLE_COUNT,
+                  stats=None, count_solutions=count_island_solutions, frontier_max_width=FRONTIER_MAX_WIDTH):
+    """
+    Counts the mine arrangements of every island (see count_island_solutions). Islands whose canonical signature is
+    still in the given cache are not searched again. Islands of at least FRONTIER_MIN_ISLAND_SIZE cells that can be
+    swept with at most frontier_max_width active constraints are counted by count_island_solutions_frontier instead of
+    being searched. If an executor is given, the remaining islands with at least inline_island_size cells are submitted
+    to it, largest first, while the smaller ones are counted in this process. Islands whose count exceeds the node
+    budget or deadline are estimated instead (see estimate_island_solutions), within the same budget.
+
+    :param island_cache: An optional IslandCache. If None, every island is searched.
+    :param executor: An optional concurrent.futures.Executor, such as one from create_island_executor.
+    :param inline_island_size: The smallest island that is worth the overhead of sending to the executor.
+    :param node_budget: The largest number of search nodes to visit per island, or None for no limit.
+    :param deadline: A time.monotonic() value after which unfinished searches are abandoned, or None for no limit.
+    :param sample_count: The number of random probes used to estimate an island.
+    :param stats: An optional SolverStats that the islands' sizes, search effort and arrangement counts are added to.
+    :param count_solutions: The exact search to use, which takes the same arguments and gives the same counts as
+                            count_island_solutions (e.g. count_island_solutions_compiled).
+    :param frontier_max_width: The largest frontier width (see frontier_width) of the islands counted by
+                               count_island_solutions_frontier, or None to search every island.
+    :return: A list of IslandSolution objects, in the same order as the islands. The cells of an IslandSolution are
+    in sorted order when a cache is used.
+    """
+
+    def choose_count_solutions(border_cell_island):
+        if frontier_max_width is not None and len(border_cell_island) >= FRONTIER_MIN_ISLAND_SIZE:
+            cell_constraints = index_island_constraints(border_cell_island, border_cells_number_neighbors,
+                                                        surrounding_mine_constraints,
+                                                        surrounding_unknown_constraints)[3]
+            if frontier_width(cell_constraints, order_frontier_cells(cell_constraints)) <= frontier_max_width:
+                return count_island_solutions_frontier
+        return count_solutions
+
+    def estimate(i):
+        island_constraints = (border_cell_islands[i], border_cells_number_neighbors, surrounding_mine_constraints,
+                              surrounding_unknown_constraints, max_mines)
+        probes = sample_count
+        for _ in range(ESTIMATE_RETRIES + 1):
+            island_solution = estimate_island_solutions(*island_constraints, probes, deadline=deadline)
+            if island_solution.get_total_count() > 0:
+                return island_solution
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            probes *= ESTIMATE_RETRY_FACTOR
+
+        # The search has already run out of budget, so rather than search again, settle for a rough estimate that no
+        # island can hold up the table for.
+        return estimate_island_densities(*island_constraints)
+
+    island_solutions = [None] * len(border_cell_islands)
+    signatures = [None] * len(border_cell_islands)
+    if island_cache is not None:
+        for i, border_cell_island in enumerate(border_cell_islands):
+            signatures[i] = island_signature(border_cell_island, border_cells_number_neighbors,
+                                             surrounding_mine_constraints, max_mines)
+            canonical_solution = island_cache.get(signatures[i][0])
+            if canonical_solution is not None:
+                offset_r, offset_c = signatures[i][1]
+                island_solutions[i] = canonical_solution.relabelled([(r + offset_r, c + offset_c)
+                                                                     for r, c in canonical_solution.island])
+    unsolved = [i for i, island_solution in enumerate(island_solutions) if island_solution is None]
+    island_counters = {i: choose_count_solutions(border_cell_islands[i]) for i in unsolved}
+
+    # Start the largest islands first, since they dominate the total time. Each task only carries its own constraints.
+    futures = {}
+    if executor is not None:
+        for i in sorted(unsolved, key=lambda i: len(border_cell_islands[i]), reverse=True):
+            border_cell_island = border_cell_islands[i]
+            if len(border_cell_island) >= inline_island_size:
+                island_neighbors = {b_cell: border_cells_number_neighbors[b_cell] for b_cell in border_cell_island}
+                number_cells = {n_cell for n_cells in island_neighbors.values() for n_cell in n_cells}
+                futures[i] = executor.submit(island_counters[i], border_cell_island, island_neighbors,
+                                             {n_cell: surrounding_mine_constraints[n_cell] for n_cell in number_cells},
+                                             {n_cell: surrounding_unknown_constraints[n_cell]
+                                              for n_cell in number_cells},
+                                             max_mines, node_budget, deadline)
+
+    frontier_time = 0.0
+    for i in unsolved:
+        if i not in futures:
+            start = time.perf_counter()
+            try:
+                island_solutions[i] = island_counters[i](border_cell_islands[i], border_cells_number_neighbors,
+                                                         surrounding_mine_constraints, surrounding_unknown_constraints,
+                                                         max_mines, node_budget, deadline)
+            except SearchBudgetExceeded:
+                island_solutions[i] = estimate(i)
+            if island_counters[i] is count_island_solutions_frontier:
+                frontier_time += time.perf_counter() - start
+    for i, future in futures.items():
+        try:
+            island_solutions[i] = future.result()
+        except SearchBudgetExceeded:
+            island_solutions[i] = estimate(i)
+
+    if stats is not None:
+        stats.cached_islands += len(border_cell_islands) - len(unsolved)
+        stats.frontier_time += frontier_time
+        for i, island_solution in enumerate(island_solutions):
+            stats.island_sizes[len(island_solution.island)] += 1
+            if island_solution.is_approximate():
+                stats.estimated_islands += 1
+                continue
+            total_count = island_solution.get_total_count()
+            stats.solution_magnitudes[len(str(total_count))] += 1
+            stats.largest_solution_count = max(stats.largest_solution_count, total_count)
+            if island_counters.get(i) is count_island_solutions_frontier:
+                stats.frontier_islands += 1
+                stats.frontier_states += island_solution.nodes_visited
+            elif island_solution.nodes_visited:
+                # Every inner node tries two branches, and every leaf is an arrangement, so the branches not taken
+                # follow from the node and arrangement counts.
+                stats.nodes_visited += island_solution.nodes_visited
+                stats.nodes_pruned += island_solution.nodes_visited - 2 * total_count + 1
+
+    # Estimates are not cached, since a later call may have the budget to solve the island exactly.
+    if island_cache is not None:
+        for i in unsolved:
+            island_solutions[i] = island_solutions[i].sorted()
+            if island_solutions[i].is_approximate():
+                continue
+            offset_r, offset_c = signatures[i][1]
+            island_cache.put(signatures[i][0], island_solutions[i].relabelled([(r - offset_r, c - offset_c)
+                                                                               for r, c in island_solutions[i].island]))
+
+    return island_solutions
+
+
+def binomial(n, k):
+    """
+    :return: The number of ways to choose k items from n, or 0 if k is out of range.
+    """
+
+    if k < 0 or k > n:
+        return 0
+    return math.comb(n, k)
+
+
+def log_binomial(n, k):
+    """
+    :return: The natural logarithm of the number of ways to choose k items from n, or -inf if k is out of range.
+    """
+
+    if k < 0 or k > n:
+        return -math.inf
+    return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+
+
+def convolve(counts1, counts2, max_length):
+    """
+    Multiplies two polynomials given as coefficient lists, discarding every coefficient past max_length terms. Here the
+    coefficient at index m counts the arrangements that use m mines.
+    """
+
+    result = [0] * min(len(counts1) + len(counts2) - 1, max_length)
+    for m1, count1 in enumerate(counts1):
+        if count1:
+            for m2, count2 in enumerate(counts2[:len(result) - m1]):
+                result[m1 + m2] += count1 * count2
+    return result
+
+
+def scaled_convolve(counts1, counts2, max_length):
+    """
+    Like convolve, but for numpy float arrays. The result is rescaled so its largest coefficient is 1, which keeps
+    products of many islands' counts from overflowing. Only the relative sizes of coefficients matter for probabilities.
+    """
+
+    result = np.convolve(counts1, counts2)[:max_length]
+    largest = result.max()
+    return result / largest if largest > 0 else result
+
+
+def combine_island_solutions(island_solutions, remaining_mines, nonborder_cell_count, confidence_intervals=None,
+                             exact=False, stats=None):
+    """
+    Combines the arrangement counts of independent islands into probabilities. Every full arrangement of border mines
+    is weighted by the number of ways to place the remaining mines among the non-border cells, so the border and
+    non-border probabilities come from the same global weighting. Instead of trying every combination of island mine
+    amounts, the islands' mine amount distributions are convolved, which takes polynomial time in the number of
+    islands. The weight of each mine amount is computed once and shared by every arrangement using it.
+
+    By default the weighting is done in floating point: each island's counts, and every partial product of them, are
+    rescaled to a largest value of 1, and the binomial weights are computed in log space relative to the largest one.
+    This cannot overflow or underflow to zero, however large the board. With exact set, the weighting is instead done
+    with exact integer counts and binomial coefficients, which is slower on large boards.
+
+    :param island_solutions: A sequence of IslandSolution objects, one for each independent island.
+    :param remaining_mines: The number of mines not yet accounted for by flags.
+    :param nonborder_cell_count: The number of unrevealed cells that are not next to any number cell.
+    :param confidence_intervals: An optional dictionary. For every cell of an approximate island, a 95% confidence
+    interval (low, high) of the probability that cell is not a mine is added to it, based on the spread of the
+    island's batch estimates.
+    :param exact: Whether to weight with exact integers rather than floating point numbers.
+    :param stats: An optional SolverStats that the number of products taken is added to.
+    :return: A 2-tuple. The first element is a dictionary from border cells to the probability that cell is not a mine.
+    The second is the probability a non-border cell is not a mine, or None if there are no non-border cells.
+    :raises ValueError: If the position contradicts itself (e.g. because of a wrong flag): an island has no consistent
+    arrangement, or no arrangement leaves a number of mines that fits the non-border cells.
+    """
+
+    if any(island_solution.get_total_count() == 0 for island_solution in island_solutions):
+        raise ValueError("an island has no mine arrangement consistent with its number cells")
+
+    # Border cells can hold at most as many mines as there are border cells.
+    max_length = min(remaining_mines, sum(len(island_solution.island) for island_solution in island_solutions)) + 1
+    if max_length <= 0:
+        raise ValueError("more cells are flagged than there are mines")
+
+    if exact:
+        island_counts = [island_solution.solution_counts for island_solution in island_solutions]
+        multiply = convolve
+        nonborder_weights = [binomial(nonborder_cell_count, remaining_mines - m) for m in range(max_length)]
+    else:
+        island_counts = [np.array([count / max(island_solution.solution_counts)
+                                   for count in island_solution.solution_counts])
+                         for island_solution in island_solutions]
+        multiply = scaled_convolve
+        log_weights = [log_binomial(nonborder_cell_count, remaining_mines - m) for m in range(max_length)]
+        largest_log_weight = max(log_weights)
+        if largest_log_weight == -math.inf:
+            raise ValueError("the remaining mines do not fit the unrevealed cells")
+        nonborder_weights = [math.exp(log_weight - largest_log_weight) for log_weight in log_weights]
+
+    # Distribution of mine amounts over the islands before / after each island.
+    prefix_counts = [[1]]
+    for counts in island_counts:
+        prefix_counts.append(multiply(prefix_counts[-1], counts, max_length))
+    suffix_counts = [[1]]
+    for counts in reversed(island_counts):
+        suffix_counts.append(multiply(suffix_counts[-1], counts, max_length))
+    suffix_counts.reverse()
+    if stats is not None:
+        stats.combinations += sum(len(prefix) * len(counts) for prefix, counts in zip(prefix_counts, island_counts))
+        stats.combinations += sum(len(suffix) * len(counts) for suffix, counts in zip(suffix_counts[1:], island_counts))
+
+    # The total weight of every global arrangement, which each island's normalizer below is (up to scaling) equal to.
+    total_counts = prefix_counts[-1]
+    total_weight = sum(count * nonborder_weights[m] for m, count in enumerate(total_counts))
+    if total_weight == 0:
+        raise ValueError("no mine arrangement leaves a number of mines that fits the non-border cells")
+
+    border_probabilities = {}
+    for i, island_solution in enumerate(island_solutions):
+        # Counts are used as they are in exact mode, and as floats relative to the island's largest count otherwise.
+        if exact:
+            scaled = int
+        else:
+            largest_count = max(island_solution.solution_counts)
+
+            def scaled(count):
+                return count / largest_count
+
+        # Weight of the island using m mines, summed over every mine amount of the other islands.
+        other_counts = multiply(prefix_counts[i], suffix_counts[i + 1], max_length)
+        mine_weights = {m: sum(count * nonborder_weights[m + m2] for m2, count in
+                               enumerate(other_counts[:max_length - m]))
+                        for m in island_solution.get_mine_amounts() if m < max_length}
+        if stats is not None:
+            stats.combinations += len(prefix_counts[i]) * len(suffix_counts[i + 1])
+            stats.combinations += sum(min(len(other_counts), max_length - m) for m in mine_weights)
+        normalizer_constant = sum(weight * scaled(island_solution.solution_counts[m])
+                                  for m, weight in mine_weights.items())
+
+        for j, b_cell in enumerate(island_solution.island):
+            border_probabilities[b_cell] = sum(weight * scaled(island_solution.solution_counts[m] -
+                                                               island_solution.cell_mine_counts[m][j])
+                                               for m, weight in mine_weights.items()) / normalizer_constant
+
+        if confidence_intervals is not None and island_solution.is_approximate():
+            batch_normalizers = [sum(weight * scaled(batch.solution_counts[m]) for m, weight in mine_weights.items())
+                                 for batch in island_solution.batches]
+            for j, b_cell in enumerate(island_solution.island):
+                batch_probabilities = [sum(weight * scaled(batch.solution_counts[m] - batch.cell_mine_counts[m][j])
+                                           for m, weight in mine_weights.items()) / batch_normalizer
+                                       for batch, batch_normalizer in zip(island_solution.batches, batch_normalizers)
+                                       if batch_normalizer > 0]
+                half_width = 1.0
+                if len(batch_probabilities) > 1:
+                    half_width = 1.96 * statistics.stdev(batch_probabilities) / math.sqrt(len(batch_probabilities))
+                probability = border_probabilities[b_cell]
+                confidence_intervals[b_cell] = (max(0.0, probability - half_width), min(1.0, probability + half_width))
+
+    nonborder_probability = None
+    if nonborder_cell_count > 0:
+        nonborder_mines = sum(count * nonborder_weights[m] * (remaining_mines - m)
+                              for m, count in enumerate(total_counts))
+        nonborder_probability = 1 - nonborder_mines / (total_weight * nonborder_cell_count)
+
+    return border_probabilities, nonborder_probability
@@ -0,0 +1,276 @@
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+from BoardCorpus import *
+from Bot import *
+
+
+# Board presets, stored as (rows, columns, mine count).
+PRESETS = {"beginner": (9, 9, 10),
+           "intermediate": (16, 16, 40),
+           "expert": (16, 30, 99)}
+
+# Island cache shared by every game played in a worker process, the bots' search budgets and solver backend, and
+# whether generated games are first click safe.
+worker_island_cache = None
+worker_time_budget = None
+worker_node_budget = None
+worker_solver_backend = None
+worker_first_click_safe = False
+
+# Corpora opened by a worker process, by path.
+worker_corpora = {}
+
+
+class GameResult:
+    """
+    The result of a single headless game played by the bot.
+
+    :ivar preset: The name of the board preset the game was played on.
+    :type preset: str
+    :ivar game_index: The index of the game within its simulation run.
+    :type game_index: int
+    :ivar outcome: The final outcome of the game.
+    :type outcome: GameOutcome
+    :ivar move_count: The number of cells the bot revealed or flagged.
+    :type move_count: int
+    :ivar guess_count: The number of reveals the bot made without being certain they were safe.
+    :type guess_count: int
+    :ivar wall_time: The wall time of the whole game in seconds.
+    :type wall_time: float
+    :ivar stats: The bot's instrumentation over the whole game.
+    :type stats: SolverStats
+    :ivar cache_hits: The number of islands that were found in the island cache during the game.
+    :type cache_hits: int
+    :ivar cache_misses: The number of islands that had to be solved during the game.
+    :type cache_misses: int
+    """
+
+    def __init__(self, preset, game_index, outcome, move_count, guess_count, wall_time, stats, cache_hits=0,
+                 cache_misses=0):
+        self.preset = preset
+        self.game_index = game_index
+        self.outcome = outcome
+        self.move_count = move_count
+        self.guess_count = guess_count
+        self.wall_time = wall_time
+        self.stats = stats
+        self.cache_hits = cache_hits
+        self.cache_misses = cache_misses
+
+    def to_dict(self):
+        return {"preset": self.preset,
+                "game_index": self.game_index,
+                "outcome": self.outcome.name,
+                "move_count": self.move_count,
+                "guess_count": self.guess_count,
+                "wall_time": self.wall_time,
+                "stats": self.stats.to_dict(),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses}
+
+
+class SimulationSummary:
+    """
+    Aggregates game results for a single board preset.
+    """
+
+    def __init__(self, preset):
+        self.preset = preset
+        self.games = 0
+        self.wins = 0
+        self.move_count = 0
+        self.guess_count = 0
+        self.game_time = 0.0
+        self.stats = SolverStats()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.start_time = time.perf_counter()
+
+    def add(self, result):
+        self.games += 1
+        if result.outcome == GameOutcome.WIN:
+            self.wins += 1
+        self.move_count += result.move_count
+        self.guess_count += result.guess_count
+        self.game_time += result.wall_time
+        self.stats.add(result.stats)
+        self.cache_hits += result.cache_hits
+        self.cache_misses += result.cache_misses
+
+    def to_dict(self):
+        """
+        :return: A JSON serializable dictionary of the summary. The games of every preset are played interleaved in the
+        same pool, so elapsed is the wall time of the whole run so far, while games_per_second and moves_per_second are
+        over the time spent playing this preset's games, summed across the workers.
+        """
+
+        elapsed = time.perf_counter() - self.start_time
+        return {"preset": self.preset,
+                "games": self.games,
+                "wins": self.wins,
+                "win_rate": self.wins / self.games if self.games else 0.0,
+                "moves": self.move_count,
+                "guesses": self.guess_count,
+                "elapsed": elapsed,
+                "game_time": self.game_time,
+                "games_per_second": self.games / self.game_time if self.game_time else 0.0,
+                "moves_per_second": self.move_count / self.game_time if self.game_time else 0.0,
+                "table_calls": self.stats.calls,
+                "mean_table_time": sum(self.stats.step_times) / self.stats.calls if self.stats.calls else 0.0,
+                "cache_hit_rate": (self.cache_hits / (self.cache_hits + self.cache_misses)
+                                   if self.cache_hits + self.cache_misses else 0.0),
+                "stats": self.stats.to_dict()}
+
+
+def play_game(task):
+    """
+    Plays a single game of minesweeper with the bot until it is won or lost.
+
+    :param task: A tuple of (preset name, rows, columns, mine count, game index, seed, corpus path). If the corpus path
+                 is not None, the game is board number game index of that corpus. Otherwise, it is generated from the
+                 seed, or from the worker's own random state if the seed is None.
+    :return: A GameResult describing the game.
+    """
+
+    preset, rows, columns, mine_count, game_index, seed, corpus_path = task
+    if seed is not None:
+        random.seed(seed)
+
+    start = time.perf_counter()
+    if corpus_path is not None:
+        if corpus_path not in worker_corpora:
+            worker_corpora[corpus_path] = BoardCorpus(corpus_path)
+        game = worker_corpora[corpus_path].get_game(game_index)
+    else:
+        game = Game(rows, columns, mine_count, seed, worker_first_click_safe)
+    bot = Bot(game, worker_island_cache, time_budget=worker_time_budget, node_budget=worker_node_budget,
+              stats=SolverStats(), solver_backend=worker_solver_backend)
+    hits, misses = bot.island_cache.hits, bot.island_cache.misses
+    move_count = 0
+    while game.get_game_outcome() == GameOutcome.INCONCLUSIVE:
+        move_count += len(bot.play_until_guess())
+        if game.get_game_outcome() == GameOutcome.INCONCLUSIVE:
+            bot.take_action(printing=False)
+            move_count += 1
+
+    return GameResult(preset, game_index, game.get_game_outcome(), move_count, bot.guess_count,
+                      time.perf_counter() - start, bot.stats, bot.island_cache.hits - hits,
+                      bot.island_cache.misses - misses)
+
+
+def __init_worker__(cache_size, time_budget, node_budget, first_click_safe, solver_backend):
+    global worker_island_cache, worker_time_budget, worker_node_budget, worker_first_click_safe, worker_solver_backend
+
+    # Forked workers inherit the parent's random state, so reseed each one independently.
+    random.seed()
+    worker_island_cache = IslandCache(cache_size)
+    worker_time_budget = time_budget
+    worker_node_budget = node_budget
+    worker_first_click_safe = first_click_safe
+
+    # Compile the kernel up front, so that it is not counted in the first game's time.
+    worker_solver_backend = default_solver_backend() if solver_backend is None else SOLVER_BACKENDS[solver_backend]
+    if worker_solver_backend is count_island_solutions_compiled:
+        warm_up_compiled_solver()
+
+
+def run_simulation(boards, games, processes=None, seed=None, chunksize=16, cache_size=4096, time_budget=None,
+                   node_budget=None, first_click_safe=False, solver_backend=None):
+    """
+    Plays games of minesweeper with the bot across a pool of worker processes, yielding each result as it finishes.
+
+    :param boards: An iterable of (preset name, rows, columns, mine count, corpus path) tuples describing the boards
+                   to play on. If the corpus path is not None, the games are played on the boards of that corpus, in
+                   order, instead of random ones.
+    :param games: The number of games to play on each board (at most the size of its corpus).
+    :param processes: The number of worker processes. Defaults to the number of CPUs.
+    :param seed: An optional base seed. Game k of each board is then generated with seed + k, making runs
+                 reproducible.
+    :param chunksize: The number of games handed to a worker at a time.
+    :param cache_size: The number of solved islands each worker process keeps cached between games.
+    :param time_budget: The bots' time budget for each probability table (see Bot.time_budget).
+    :param node_budget: The bots' node budget for each island (see Bot.node_budget).
+    :param first_click_safe: Whether generated games place their mines after the first reveal, away from it. Corpus
+                             games always keep their stored mines.
+    :param solver_backend: The name of the bots' solver backend (see SOLVER_BACKENDS), or None for the default.
+    :return: A generator of GameResult objects, in completion order.
+    """
+
+    tasks = ((preset, rows, columns, mine_count, k, None if seed is None else seed + k, corpus_path)
+             for preset, rows, columns, mine_count, corpus_path in boards
+             for k in range(games if corpus_path is None else min(games, len(BoardCorpus(corpus_path)))))
+
+    initargs = (cache_size, time_budget, node_budget, first_click_safe, solver_backend)
+    with multiprocessing.Pool(processes, initializer=__init_worker__, initargs=initargs) as pool:
+        for result in pool.imap_unordered(play_game, tasks, chunksize=chunksize):
+            yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play minesweeper games with the bot without a display.")
+    parser.add_argument("--preset", nargs="+", choices=sorted(PRESETS) + ["custom"])
+    parser.add_argument("--rows", type=int)
+    parser.add_argument("--columns", type=int)
+    parser.add_argument("--mines", type=int)
+    parser.add_argument("--corpus", nargs="+", default=[], help="Corpus files (see BoardCorpus.py) to play through.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--cache-size", type=int, default=4096)
+    parser.add_argument("--time-budget", type=float)
+    parser.add_argument("--node-budget", type=int)
+    parser.add_argument("--first-click-safe", action="store_true")
+    parser.add_argument("--solver-backend", choices=sorted(SOLVER_BACKENDS),
+                        help="Defaults to the compiled backend if numba is installed.")
+    parser.add_argument("--output", help="File to stream per-game results to as JSON lines.")
+    parser.add_argument("--report-every", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    boards = []
+    for preset in args.preset or ([] if args.corpus else ["expert"]):
+        if preset != "custom":
+            boards.append((preset,) + PRESETS[preset] + (None,))
+        elif None in (args.rows, args.columns, args.mines):
+            parser.error("the custom preset requires --rows, --columns and --mines")
+        else:
+            boards.append((preset, args.rows, args.columns, args.mines, None))
+    for corpus_path in args.corpus:
+        corpus = BoardCorpus(corpus_path)
+        boards.append((corpus_path, corpus.rows, corpus.columns, corpus.metadata.get("mine_count"), corpus_path))
+
+    # The compiled backend's one-off warm-up (compiling, or loading from numba's cache) is reported on its own, and
+    # every worker warms up before playing, so it does not skew the throughput.
+    solver_backend = default_solver_backend() if args.solver_backend is None else SOLVER_BACKENDS[args.solver_backend]
+    if solver_backend is count_island_solutions_compiled:
+        print(json.dumps({"solver_backend": "compiled", "compiled": numba is not None,
+                          "warm_up_time": warm_up_compiled_solver()}), file=sys.stderr)
+
+    summaries = {preset: SimulationSummary(preset) for preset, _, _, _, _ in boards}
+    finished = 0
+    output = open(args.output, "w") if args.output else None
+    try:
+        for result in run_simulation(boards, args.games, processes=args.processes, seed=args.seed,
+                                     cache_size=args.cache_size, time_budget=args.time_budget,
+                                     node_budget=args.node_budget, first_click_safe=args.first_click_safe,
+                                     solver_backend=args.solver_backend):
+            summaries[result.preset].add(result)
+            finished += 1
+            if output:
+                output.write(json.dumps(result.to_dict()) + "\n")
+            if args.report_every and finished % args.report_every == 0:
+                print(json.dumps(summaries[result.preset].to_dict()), file=sys.stderr)
+    finally:
+        if output:
+            output.close()
+
+    for summary in summaries.values():
+        print(json.dumps(summary.to_dict()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import argparse
+import json
+import multiprocessing
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Bot import *
+
+
+# Characters of the compact position encoding (see encode_position) for cells that are not revealed numbers.
+UNREVEALED = "."
+FLAGGED = "F"
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Island cache shared by every position solved in a worker process, and the bots' search budgets.
+worker_island_cache = None
+worker_time_budget = None
+worker_node_budget = None
+
+
+class ServiceBusyError(RuntimeError):
+    """
+    Raised when a batch would take a solver service over its limit of pending positions.
+    """
+
+
+class UnsolvablePositionError(ValueError):
+    """
+    Raised when a well-formed position has no mine arrangement consistent with it, e.g. because of a wrong flag.
+    """
+
+
+def encode_position(game):
+    """
+    Encodes what a player can see of a game, as a JSON serializable dictionary.
+
+    :param game: The game to encode.
+    :return: A dictionary of the board's rows, columns and total mine count, and its cells as a single string in
+    row-major order, with one character per cell: the surrounding mine count of a revealed cell, FLAGGED for a flagged
+    cell, or UNREVEALED for any other cell.
+    """
+
+    cells = []
+    for row in range(game.get_rows()):
+        for column in range(game.get_columns()):
+            if game.is_revealed(row, column):
+                cells.append(str(game.get_surrounding_count(row, column)))
+            else:
+                cells.append(FLAGGED if game.is_flagged(row, column) else UNREVEALED)
+    return {"rows": game.get_rows(), "columns": game.get_columns(), "mines": game.get_mine_count(),
+            "cells": "".join(cells)}
+
+
+def decode_position(position):
+    """
+    :param position: A position made by encode_position.
+    :return: A game in that position (see Game.from_visible_state).
+    :raises ValueError: If the position is malformed, or its mine count does not fit its flagged and unrevealed cells.
+    :raises UnsolvablePositionError: If a number cell contradicts the cells around it.
+    """
+
+    rows, columns, mines, cells = position["rows"], position["columns"], position["mines"], position["cells"]
+    if any(type(value) is not int for value in (rows, columns, mines)) or rows < 1 or columns < 1 or mines < 0:
+        raise ValueError("expected integer rows and columns of at least 1, and mines of at least 0")
+    if (type(cells) is not str or len(cells) != rows * columns or
+            not set(cells) <= set("012345678" + UNREVEALED + FLAGGED)):
+        raise ValueError(f"expected {rows * columns} cells of 0-8, {UNREVEALED!r} or {FLAGGED!r}")
+    flagged_count = cells.count(FLAGGED)
+    unrevealed_count = flagged_count + cells.count(UNREVEALED)
+    if not flagged_count <= mines <= unrevealed_count:
+        raise ValueError(f"expected between {flagged_count} and {unrevealed_count} mines, for the flagged and "
+                         f"unrevealed cells")
+    grid = np.frombuffer(cells.encode(), dtype=np.uint8).reshape(rows, columns)
+    revealed_mask = (grid >= ord("0")) & (grid <= ord("8"))
+    flagged_mask = grid == ord(FLAGGED)
+    surrounding_counts = np.where(revealed_mask, grid - ord("0"), 0)
+
+    # Every number cell needs at least as many mines around it as flags, and at most as many as unrevealed cells.
+    flagged_counts = count_neighbours(flagged_mask)
+    unrevealed_counts = flagged_counts + count_neighbours(~revealed_mask & ~flagged_mask)
+    if np.any(revealed_mask & ((surrounding_counts < flagged_counts) | (surrounding_counts > unrevealed_counts))):
+        raise UnsolvablePositionError("a number cell's count does not fit the flagged and unrevealed cells around it")
+    return Game.from_visible_state(surrounding_counts, revealed_mask, flagged_mask, mines)
+
+
+def solve_position(position):
+    """
+    Solves a single position in a worker process.
+
+    :param position: A position made by encode_position.
+    :return: The probability that each cell is not a mine, as a list in row-major order, with None for revealed cells.
+    :raises ValueError: If the position is malformed (see decode_position).
+    :raises UnsolvablePositionError: If the position contradicts itself.
+    """
+
+    game = decode_position(position)
+    bot = Bot(game, worker_island_cache, time_budget=worker_time_budget, node_budget=worker_node_budget)
+    try:
+        probability_table = bot.construct_probability_tables()
+    except ValueError as error:
+        raise UnsolvablePositionError(str(error)) from None
+    return [probability_table.get((row, column)) for row in range(game.get_rows())
+            for column in range(game.get_columns())]
+
+
+def __init_worker__(cache_size, time_budget, node_budget):
+    global worker_island_cache, worker_time_budget, worker_node_budget
+
+    worker_island_cache = IslandCache(cache_size)
+    worker_time_budget = time_budget
+    worker_node_budget = node_budget
+
+
+class SolverService:
+    """
+    Solves batches of positions across a persistent pool of worker processes, whose island caches stay warm between
+    batches. Batches that would take the number of pending positions over max_pending are refused with a
+    ServiceBusyError, so that callers back off rather than queueing without bound.
+
+    :ivar max_pending: The most positions that may be waiting or being solved at once.
+    :type max_pending: int
+    :ivar chunksize: The number of positions of a batch handed to a worker at a time.
+    :type chunksize: int
+    """
+
+    def __init__(self, processes=None, cache_size=4096, time_budget=None, node_budget=None, max_pending=1024,
+                 chunksize=4):
+        self.max_pending = max_pending
+        self.chunksize = chunksize
+
+        self.__pool__ = multiprocessing.Pool(processes, initializer=__init_worker__,
+                                             initargs=(cache_size, time_budget, node_budget))
+        self.__lock__ = threading.Lock()
+        self.__pending__ = 0
+        self.__positions__ = 0
+        self.__batches__ = 0
+        self.__rejected__ = 0
+        self.__solve_time__ = 0.0
+        self.__start_time__ = time.monotonic()
+
+    def solve(self, positions):
+        """
+        Solves a batch of positions, blocking until all of them are done.
+
+        :param positions: A list of positions made by encode_position.
+        :return: A list of the probabilities of each position (see solve_position), in order.
+        """
+
+        with self.__lock__:
+            if self.__pending__ > 0 and self.__pending__ + len(positions) > self.max_pending:
+                self.__rejected__ += 1
+                raise ServiceBusyError(f"{self.__pending__} positions are already pending")
+            self.__pending__ += len(positions)
+
+        start = time.perf_counter()
+        try:
+            tables = self.__pool__.map(solve_position, positions, chunksize=self.chunksize)
+        finally:
+            with self.__lock__:
+                self.__pending__ -= len(positions)
+        elapsed = time.perf_counter() - start
+
+        with self.__lock__:
+            self.__positions__ += len(positions)
+            self.__batches__ += 1
+            self.__solve_time__ += elapsed
+        return tables
+
+    def get_stats(self):
+        """
+        :return: A JSON serializable dictionary of the positions and batches solved so far, the number pending, the
+        number of batches refused, and the throughput in positions per second, both over the time spent solving
+        batches and over the service's uptime.
+        """
+
+        with self.__lock__:
+            uptime = time.monotonic() - self.__start_time__
+            return {"positions": self.__positions__,
+                    "batches": self.__batches__,
+                    "pending": self.__pending__,
+                    "rejected_batches": self.__rejected__,
+                    "positions_per_second": self.__positions__ / self.__solve_time__ if self.__solve_time__ else 0.0,
+                    "uptime_positions_per_second": self.__positions__ / uptime if uptime else 0.0}
+
+    def close(self):
+        self.__pool__.terminate()
+        self.__pool__.join()
+
+
+class SolverRequestHandler(BaseHTTPRequestHandler):
+    """
+    The HTTP front end of a SolverService. POST /solve takes a JSON object {"positions": [...]} and answers with
+    {"tables": [...], "positions_per_second": ...}, or 503 with a Retry-After header if the service is busy. Malformed
+    requests are answered with 400, positions that contradict themselves with 422, and any other solver failure with
+    500. GET /stats answers with the service's statistics (see SolverService.get_stats).
+    """
+
+    # Set on the subclass made by make_server.
+    service = None
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.__reply__(404, {"error": "not found"})
+            return
+        self.__reply__(200, self.service.get_stats())
+
+    def do_POST(self):
+        if self.path != "/solve":
+            self.__reply__(404, {"error": "not found"})
+            return
+        try:
+            positions = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))["positions"]
+            start = time.perf_counter()
+            tables = self.service.solve(positions)
+        except ServiceBusyError as error:
+            self.__reply__(503, {"error": str(error)}, {"Retry-After": "1"})
+        except UnsolvablePositionError as error:
+            self.__reply__(422, {"error": f"unsolvable position: {error}"})
+        except (ValueError, KeyError, TypeError) as error:
+            self.__reply__(400, {"error": f"invalid request: {error!r}"})
+        except Exception as error:
+            self.__reply__(500, {"error": f"solver failed: {error!r}"})
+        else:
+            elapsed = time.perf_counter() - start
+            positions_per_second = len(positions) / elapsed if elapsed else 0.0
+            self.__reply__(200, {"tables": tables, "positions_per_second": positions_per_second})
+
+    def __reply__(self, status, body, headers=None):
+        content = json.dumps(body, allow_nan=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    :param service: The SolverService to serve.
+    :param host: The address to listen on. Defaults to the local machine only.
+    :param port: The port to listen on, or 0 for any free port.
+    :return: A threading HTTP server for the service, which is not yet serving.
+    """
+
+    handler = type("BoundSolverRequestHandler", (SolverRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def request_tables(positions, host=DEFAULT_HOST, port=DEFAULT_PORT, retries=10):
+    """
+    Solves a batch of positions with a running solver service, retrying while the service is busy.
+
+    :param positions: A list of positions made by encode_position.
+    :param host: The address of the service.
+    :param port: The port of the service.
+    :param retries: The number of times to retry a batch the service refused as busy.
+    :return: A list of the probabilities of each position (see solve_position), in order.
+    """
+
+    request = urllib.request.Request(f"http://{host}:{port}/solve", json.dumps({"positions": positions}).encode(),
+                                     {"Content-Type": "application/json"})
+    for attempt in range(retries + 1):
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read())["tables"]
+        except urllib.error.HTTPError as error:
+            if error.code != 503 or attempt == retries:
+                raise
+            time.sleep(float(error.headers.get("Retry-After", 1)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve batch probability queries over HTTP on the local machine.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--cache-size", type=int, default=4096)
+    parser.add_argument("--time-budget", type=float)
+    parser.add_argument("--node-budget", type=int)
+    parser.add_argument("--max-pending", type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    service = SolverService(args.processes, args.cache_size, args.time_budget, args.node_budget, args.max_pending)
+    server = make_server(service, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
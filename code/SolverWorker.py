@@ -0,0 +1,123 @@
+import queue
+import threading
+
+from Bot import *
+
+
+# Request kinds: a probability table, or the cells the bot would reveal / flag next.
+TABLE = "table"
+ACTION = "action"
+
+
+class SolverWorker:
+    """
+    Runs the bot's solver in a background thread, so that a front end stays responsive while expensive positions are
+    computed. Requests are made on a copy of the game, and their results are collected with poll.
+
+    Requests made before a call to cancel (e.g. because the board changed) are stale: those still queued are skipped,
+    and the result of one already being computed is dropped when it finishes. A request that fails, e.g. on a position
+    that contradicts itself because of a wrong flag, gives the exception raised as its result, and the worker carries
+    on with the next request.
+
+    :ivar island_cache: The cache of solved islands shared by every request, kept warm between them.
+    :type island_cache: IslandCache
+    :ivar time_budget: The time budget of the bot used for each request (see Bot.time_budget).
+    :type time_budget: float
+    :ivar node_budget: The node budget of the bot used for each request (see Bot.node_budget).
+    :type node_budget: int
+    """
+
+    def __init__(self, island_cache=None, time_budget=None, node_budget=None):
+        self.island_cache = IslandCache() if island_cache is None else island_cache
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+
+        self.__requests__ = queue.Queue()
+        self.__results__ = queue.Queue()
+        self.__lock__ = threading.Lock()
+        self.__generation__ = 0
+        self.__pending__ = set()
+        self.__thread__ = threading.Thread(target=self.__run__, daemon=True)
+        self.__thread__.start()
+
+    def submit(self, kind, game):
+        """
+        Queues a request for the current state of a game.
+
+        :param kind: TABLE for a probability table (see Bot.construct_probability_tables), or ACTION for the cells the
+                     bot would reveal and flag next (see Bot.deduce).
+        :param game: The game to solve. It is forked, so it may keep changing while the request is computed.
+        """
+
+        with self.__lock__:
+            self.__pending__.add(kind)
+            self.__requests__.put((self.__generation__, kind, game.fork()))
+
+    def is_pending(self, kind):
+        """
+        :param kind: A request kind (TABLE or ACTION).
+        :return: Whether a request of that kind has been submitted, but its result has not yet been polled or
+        cancelled.
+        """
+
+        with self.__lock__:
+            return kind in self.__pending__
+
+    def cancel(self):
+        """
+        Makes every request submitted so far stale.
+        """
+
+        with self.__lock__:
+            self.__generation__ += 1
+            self.__pending__.clear()
+
+    def poll(self):
+        """
+        Collects the results that have finished since the last call, without waiting for any others.
+
+        :return: A list of 2-tuples of the request kind and its result. A TABLE result is a probability table, and an
+        ACTION result is a 3-tuple of the set of cells to reveal, the set of cells to flag, and the number of guesses
+        the bot made in choosing them. The result of a failed request is the exception it raised.
+        """
+
+        results = []
+        while True:
+            try:
+                generation, kind, result = self.__results__.get_nowait()
+            except queue.Empty:
+                return results
+            with self.__lock__:
+                if generation != self.__generation__:
+                    continue
+                self.__pending__.discard(kind)
+            results.append((kind, result))
+
+    def close(self):
+        """
+        Cancels every request and stops the worker thread once it finishes the one it is computing, if any.
+        """
+
+        self.cancel()
+        self.__requests__.put(None)
+        self.__thread__.join()
+
+    def __run__(self):
+        while True:
+            request = self.__requests__.get()
+            if request is None:
+                return
+            generation, kind, game = request
+            if generation != self.__generation__:
+                continue
+
+            try:
+                bot = Bot(game, self.island_cache, time_budget=self.time_budget, node_budget=self.node_budget)
+                if kind == TABLE:
+                    result = bot.construct_probability_tables()
+                else:
+                    bot.deduce()
+                    result = (bot.to_reveal, bot.to_flag, bot.guess_count)
+            except Exception as error:
+                result = error
+            self.__results__.put((generation, kind, result))
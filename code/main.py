@@ -1,13 +1,15 @@
 import pygame
 import sys
 
-from Bot import *
+from SolverWorker import *
 
 
 # Set Parameters
 ROWS = 40
 COLUMNS = 40
 MINE_RATE = 0.15
+FIRST_CLICK_SAFE = False
+FRAME_RATE = 60
 
 MINES = ROWS*COLUMNS // int(1/MINE_RATE)
 IMAGE_SIZE = 20
@@ -30,6 +32,31 @@ COVERED_CELL_HIGHLIGHTED = pygame.image.load('../skins/covered_square_highlighte
 FLAG = pygame.image.load('../skins/flag.png')
 LOST_REVEALED_CELL = pygame.image.load('../skins/lost_square_highlighted.png')
 
+
+def composite(*images):
+    """
+    Stacks skins on top of each other into a single tile, so that drawing a cell takes a single blit.
+
+    :param images: The skins to stack, from the bottom up.
+    :return: A new surface holding the combined tile.
+    """
+
+    tile = images[0].copy()
+    for image in images[1:]:
+        tile.blit(image, (0, 0))
+    return tile.convert_alpha()
+
+
+# Pre-composited tiles, keyed by surrounding mine count (or MINE) for revealed cells and by (highlighted, overlay) for
+# covered ones.
+REVEALED_TILES = {0: REVEALED_CELL.convert_alpha(), MINE: composite(LOST_REVEALED_CELL, BOMB)}
+REVEALED_TILES.update({i: composite(REVEALED_CELL, NUM_DICT[i]) for i in range(1, 9)})
+COVERED_TILES = {}
+for highlighted, covered_skin in ((False, COVERED_CELL), (True, COVERED_CELL_HIGHLIGHTED)):
+    COVERED_TILES[(highlighted, None)] = covered_skin.convert_alpha()
+    COVERED_TILES[(highlighted, FLAG)] = composite(covered_skin, FLAG)
+    COVERED_TILES[(highlighted, BOMB)] = composite(covered_skin, BOMB)
+
 PROBABILITY_SKINS = {NOT_MINE: pygame.image.load('../skins/probabilities/1.png'),
                      MINE: pygame.image.load('../skins/probabilities/0.png'),
                      1.0: pygame.image.load('../skins/probabilities/10.png'),
@@ -43,16 +70,71 @@ PROBABILITY_SKINS = {NOT_MINE: pygame.image.load('../skins/probabilities/1.png')
                      0.2: pygame.image.load('../skins/probabilities/02.png'),
                      0.1: pygame.image.load('../skins/probabilities/01.png'),
                      0.0: pygame.image.load('../skins/probabilities/00.png')}
+PROBABILITY_SKINS = {key: skin.convert_alpha() for key, skin in PROBABILITY_SKINS.items()}
+
+
+def draw_cell(surface, row, column, selected, probability_tables):
+    """
+    Draws a single cell of the game, and its probability if it has one, onto the board surface.
+
+    :param surface: The cached board surface to draw onto.
+    :param row: The row of the cell.
+    :param column: The column of the cell.
+    :param selected: The (row, column) of the cell under the mouse, which is highlighted if covered.
+    :param probability_tables: The probability tables currently displayed.
+    :return: The rectangle of the surface that was drawn over.
+    """
+
+    position = (column * IMAGE_SIZE, row * IMAGE_SIZE)
+    if game.is_revealed(row, column):
+        if game.is_mine(row, column):
+            surface.blit(REVEALED_TILES[MINE], position)
+        else:
+            surface.blit(REVEALED_TILES[game.get_surrounding_count(row, column)], position)
+    else:
+        if game.get_game_outcome() == GameOutcome.INCONCLUSIVE:
+            overlay = FLAG if game.is_flagged(row, column) else None
+        else:
+            overlay = BOMB if game.is_mine(row, column) else None
+        surface.blit(COVERED_TILES[((row, column) == selected, overlay)], position)
+
+    prob = probability_tables.get((row, column))
+    if prob is not None:
+        if prob == 1.0:
+            surface.blit(PROBABILITY_SKINS[NOT_MINE], position)
+        elif prob == 0.0:
+            surface.blit(PROBABILITY_SKINS[MINE], position)
+        else:
+            surface.blit(PROBABILITY_SKINS[round(prob, 1)], position)
+    return pygame.Rect(position, (IMAGE_SIZE, IMAGE_SIZE))
 
 
 # Initialize Game Variables.
-game = Game(ROWS, COLUMNS, MINES)
+game = Game(ROWS, COLUMNS, MINES, first_click_safe=FIRST_CLICK_SAFE)
 selected_row, selected_column = 0, 0
 probability_tables = {}
 bot = Bot(game)
 
+# The solver runs in a background worker, and its requests are cancelled whenever the board changes. Kinds of request
+# that failed or came back empty are not made again until the board changes, as they would only do the same.
+worker = SolverWorker(bot.island_cache)
+solved_state = (game, game.get_state_version())
+settled_kinds = set()
+
+# Rendering state. Only cells in the game's change feed, or whose highlight, probability or visibility changed since the
+# last frame, are redrawn onto the cached board surface.
+board_surface = pygame.Surface(screen.get_size()).convert()
+changed_cells = game.watch_changes()
+drawn_selection = None
+drawn_probability_tables = {}
+drawn_outcome = None
+
+# Frames are capped, so that an idle window does not keep a core busy.
+clock = pygame.time.Clock()
+
 # Main Loop
 while True:
+    action_requested = False
     for event in pygame.event.get():
         selected_row, selected_column = pygame.mouse.get_pos()[1] // IMAGE_SIZE, pygame.mouse.get_pos()[0] // IMAGE_SIZE
 
@@ -61,7 +143,6 @@ while True:
             sys.exit()
 
         # Make Moves
-        pressed_keys = pygame.key.get_pressed()
         if event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 1:
                 game.chain_reveal(selected_row, selected_column)
@@ -70,7 +151,6 @@ while True:
                     game.flag(selected_row, selected_column)
                 elif game.is_flagged(selected_row, selected_column):
                     game.unflag(selected_row, selected_column)
-            probability_tables.clear()
 
         if event.type == pygame.KEYDOWN:
 
@@ -79,12 +159,13 @@ while True:
                 game.undo_reveal()
                 bot.to_flag.clear()
                 bot.to_reveal.clear()
-                probability_tables.clear()
 
             # Restart
             if event.key == pygame.K_r:
-                game = Game(ROWS, COLUMNS, MINES)
-                bot = Bot(game)
+                game = Game(ROWS, COLUMNS, MINES, first_click_safe=FIRST_CLICK_SAFE)
+                bot = Bot(game, worker.island_cache)
+                changed_cells = game.watch_changes()
+                drawn_outcome = None
 
             # Quit
             if event.key == pygame.K_ESCAPE:
@@ -92,55 +173,77 @@ while True:
 
             # Single Deduction Bot.
             if event.key == pygame.K_SPACE:
-                bot.take_action()
-                probability_tables.clear()
-
-        # Chain deduction Bot.
-        elif pressed_keys[pygame.K_b]:
+                action_requested = True
+
+    # Cancel solver requests for a board that has since changed, before their results can be collected.
+    if solved_state != (game, game.get_state_version()):
+        worker.cancel()
+        probability_tables = {}
+        solved_state = (game, game.get_state_version())
+        settled_kinds.clear()
+
+    # Collect solver results. The bot's chosen cell(s) are queued, and one of them is played.
+    pressed_keys = pygame.key.get_pressed()
+    for kind, result in worker.poll():
+        if isinstance(result, Exception):
+            print("SOLVER FAILED:", repr(result))
+            settled_kinds.add(kind)
+        elif kind == TABLE:
+            if not result:
+                settled_kinds.add(TABLE)
+            if pressed_keys[pygame.K_p]:
+                probability_tables = result
+        else:
+            to_reveal, to_flag, guess_count = result
+            if not to_reveal and not to_flag:
+                settled_kinds.add(ACTION)
+            bot.to_reveal.update(to_reveal)
+            bot.to_flag.update(to_flag)
+            bot.guess_count += guess_count
             bot.take_action()
-            probability_tables.clear()
 
-        # Probability Display.
-        if pressed_keys[pygame.K_p]:
-            if game.get_game_outcome() == GameOutcome.INCONCLUSIVE:
-                if probability_tables == {}:
-                    probability_tables = bot.construct_probability_tables()
-        else:
-            if probability_tables:
-                probability_tables.clear()
+    # Single / Chain deduction Bot. Queued cells are played straight away, otherwise the worker is asked for more.
+    if action_requested or pressed_keys[pygame.K_b]:
+        if bot.has_queued_moves():
+            bot.take_action()
+        elif (game.get_game_outcome() == GameOutcome.INCONCLUSIVE and not worker.is_pending(ACTION) and
+              ACTION not in settled_kinds):
+            worker.submit(ACTION, game)
+
+    # Probability Display.
+    if pressed_keys[pygame.K_p]:
+        if game.get_game_outcome() == GameOutcome.INCONCLUSIVE:
+            if probability_tables == {} and not worker.is_pending(TABLE) and TABLE not in settled_kinds:
+                worker.submit(TABLE, game)
+    else:
+        if probability_tables:
+            probability_tables = {}
+
+    # Find the cells to redraw. The whole board is redrawn when the game ends or restarts, as that reveals or hides the
+    # mines and flags.
+    selected = (selected_row, selected_column)
+    if game.get_game_outcome() != drawn_outcome:
+        dirty_cells = [(row, column) for row in range(ROWS) for column in range(COLUMNS)]
+    else:
+        dirty_cells = set(changed_cells)
+        if selected != drawn_selection:
+            dirty_cells.update((drawn_selection, selected))
+        if probability_tables is not drawn_probability_tables:
+            dirty_cells.update(drawn_probability_tables)
+            dirty_cells.update(probability_tables)
+    changed_cells.clear()
+    drawn_selection = selected
+    drawn_probability_tables = probability_tables
+    drawn_outcome = game.get_game_outcome()
 
     # Display Minesweeper Game.
-    for row in range(ROWS):
-        for column in range(COLUMNS):
-            if game.is_revealed(row, column):
-                if game.is_mine(row, column):
-                    screen.blit(LOST_REVEALED_CELL, (column * IMAGE_SIZE, row * IMAGE_SIZE))
-                    screen.blit(BOMB, (column * IMAGE_SIZE, row * IMAGE_SIZE))
-                else:
-                    screen.blit(REVEALED_CELL, (column * IMAGE_SIZE, row * IMAGE_SIZE))
-                    surrounding_mines = game.get_surrounding_count(row, column)
-                    if surrounding_mines > 0:
-                        screen.blit(NUM_DICT[surrounding_mines], (column * IMAGE_SIZE, row * IMAGE_SIZE))
-            else:
-                if row == selected_row and column == selected_column:
-                    screen.blit(COVERED_CELL_HIGHLIGHTED, (column * IMAGE_SIZE, row * IMAGE_SIZE))
-                else:
-                    screen.blit(COVERED_CELL, (column * IMAGE_SIZE, row * IMAGE_SIZE))
-                if game.get_game_outcome() == GameOutcome.INCONCLUSIVE:
-                    if game.is_flagged(row, column):
-                        screen.blit(FLAG, (column * IMAGE_SIZE, row * IMAGE_SIZE))
-                else:
-                    if game.is_mine(row, column):
-                        screen.blit(BOMB, (column * IMAGE_SIZE, row * IMAGE_SIZE))
-
-    # Display Probabilities.
-    for r, c in probability_tables:
-        prob = probability_tables[(r, c)]
-        if prob == 1.0:
-            screen.blit(PROBABILITY_SKINS[NOT_MINE], (c * IMAGE_SIZE, r * IMAGE_SIZE))
-        elif prob == 0.0:
-            screen.blit(PROBABILITY_SKINS[MINE], (c * IMAGE_SIZE, r * IMAGE_SIZE))
-        else:
-            screen.blit(PROBABILITY_SKINS[round(prob, 1)], (c * IMAGE_SIZE, r * IMAGE_SIZE))
-
-    pygame.display.update()
+    dirty_rects = [draw_cell(board_surface, row, column, selected, probability_tables)
+                   for row, column in dirty_cells if 0 <= row < ROWS and 0 <= column < COLUMNS]
+    if len(dirty_rects) > ROWS * COLUMNS // 4:
+        screen.blit(board_surface, (0, 0))
+        pygame.display.update()
+    elif dirty_rects:
+        for rect in dirty_rects:
+            screen.blit(board_surface, rect, rect)
+        pygame.display.update(dirty_rects)
+    clock.tick(FRAME_RATE)